@@ -7,7 +7,9 @@ Application Entry Point - 应用入口
 import os
 import sys
 import time
+import socket
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from http.server import ThreadingHTTPServer
 
 # 确保可以导入本地模块
@@ -19,12 +21,86 @@ from services.database_service import database_service
 from handlers.api import APIHandler
 
 
+class TreeDBHTTPServer(ThreadingHTTPServer):
+    """由固定大小线程池服务连接的HTTP服务器，扩大监听队列以承受并发连接突发
+
+    线程复用而不是每个连接新建；超过 max_connections 的连接在线程池队列中等待，
+    线程数量（以及随之而来的 GIL 切换开销）有上限。
+    """
+
+    # socketserver 默认的 listen 队列只有 5，突发连接会被内核丢弃并等待 SYN 重传
+    request_queue_size = 128
+    # 必须在构造（bind）之前生效，实例化后再设置不起作用
+    allow_reuse_address = True
+
+    def __init__(self, server_address, handler_class, max_connections: int = 256):
+        super().__init__(server_address, handler_class)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_connections, thread_name_prefix='treedb-http'
+        )
+        self._active = set()
+        # 已接受、仍在线程池队列中等待线程的连接 -> 对应的 Future，关闭时取消并关闭这些连接
+        self._queued = {}
+        # 已接受、仍在线程池队列中等待线程的连接数
+        self._waiting = 0
+        self._active_lock = threading.Lock()
+
+    def has_waiting_connections(self) -> bool:
+        """是否有连接在等待空闲线程"""
+        return self._waiting > 0
+
+    def process_request(self, request, client_address):
+        """把连接交给线程池处理"""
+        # 持锁提交：线程池线程开始处理前一定能在 _queued 中找到并移除该连接
+        with self._active_lock:
+            self._waiting += 1
+            self._queued[request] = self._executor.submit(
+                self._serve_connection, request, client_address
+            )
+
+    def _serve_connection(self, request, client_address):
+        """在线程池线程中处理一个连接直至关闭"""
+        with self._active_lock:
+            self._waiting -= 1
+            self._queued.pop(request, None)
+            self._active.add(request)
+        try:
+            self.process_request_thread(request, client_address)
+        finally:
+            with self._active_lock:
+                self._active.discard(request)
+
+    def server_close(self):
+        """关闭监听套接字，中断空闲的持久连接并停止线程池
+
+        仍在队列中等待的连接取消其任务，取消成功（不会再被线程处理）的连接在这里直接关闭。
+        """
+        super().server_close()
+        with self._active_lock:
+            active = list(self._active)
+            queued = list(self._queued.items())
+            self._queued.clear()
+        for request in active:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        for request, future in queued:
+            if future.cancel():
+                with self._active_lock:
+                    self._waiting -= 1
+                self.shutdown_request(request)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
 class TreeDBApplication:
     """TreeDB应用 - 单一职责：管理应用生命周期"""
 
     def __init__(self):
         self.server = None
         self.cleanup_thread = None
+        self.optimize_thread = None
+        self._stopped = threading.Event()
         self.running = False
 
     def initialize(self):
@@ -39,43 +115,65 @@ class TreeDBApplication:
         database_service.ensure_schema()
 
         # 刷新元数据
-        database_service.refresh_column_types()
-        database_service.refresh_foreign_keys()
+        database_service.refresh_metadata()
+
+        # 启动时更新查询规划器统计信息，首个请求即可使用
+        self.optimize_database()
 
         print("Database initialized successfully")
 
     def start_cleanup_worker(self):
         """启动清理工作线程"""
         def cleanup_worker():
-            """清理工作线程"""
+            """清理工作线程：等待到最近的会话到期时间再批量清理，空闲时不唤醒"""
             while self.running:
                 try:
-                    session_service.cleanup_expired_sessions()
-                    time.sleep(60)  # 每分钟清理一次
+                    session_service.run_expiry_cycle()
                 except Exception as e:
                     print(f"Cleanup worker error: {e}")
-                    time.sleep(60)
+                    time.sleep(1)
 
         self.cleanup_thread = threading.Thread(target=cleanup_worker, daemon=True)
         self.cleanup_thread.start()
         print("Cleanup worker started")
 
+    def optimize_database(self):
+        """对当前数据库执行 PRAGMA optimize，失败时只打印错误"""
+        try:
+            database_service.optimize()
+        except Exception as e:
+            print(f"Optimize error: {e}")
+
+    def start_optimize_worker(self):
+        """启动定期执行 PRAGMA optimize 的工作线程"""
+        interval = config.OPTIMIZE_INTERVAL_SECONDS
+        if interval <= 0:
+            return
+
+        def optimize_worker():
+            while not self._stopped.wait(interval):
+                self.optimize_database()
+
+        self.optimize_thread = threading.Thread(target=optimize_worker, daemon=True)
+        self.optimize_thread.start()
+
     def create_server(self):
         """创建HTTP服务器"""
-        self.server = ThreadingHTTPServer(
+        self.server = TreeDBHTTPServer(
             (config.host, config.port),
-            APIHandler
+            APIHandler,
+            max_connections=config.MAX_CONNECTIONS
         )
-        self.server.allow_reuse_address = True
 
     def run(self):
         """运行应用"""
         try:
             self.initialize()
+            self.running = True
             self.start_cleanup_worker()
+            self.start_optimize_worker()
             self.create_server()
 
-            self.running = True
             print(f"\nServer listening on http://{config.host}:{config.port}")
             print("Press Ctrl+C to stop\n")
 
@@ -91,9 +189,13 @@ class TreeDBApplication:
     def stop(self):
         """停止应用"""
         self.running = False
+        self._stopped.set()
+        session_service.wake_cleanup_worker()
         if self.server:
             self.server.shutdown()
             self.server.server_close()
+        self.optimize_database()
+        database_service.close_connections()
         print("Server stopped")
 
 
@@ -0,0 +1,243 @@
+"""
+Async Application Entry Point - 异步应用入口
+基于 asyncio 的HTTP服务器，安装了 uvloop 时使用 uvloop 事件循环
+设置 TREEDB_USE_IO_URING=1 且 Linux 上可用 io_uring 时使用 io_uring 后端（见 io_uring_loop.py）
+请求的处理逻辑复用 APIHandler，在有界线程池中执行阻塞的数据库操作
+超过缓存上限的静态文件由事件循环以 sendfile 发送
+"""
+
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Optional, Tuple
+
+# 确保可以导入本地模块
+sys.path.insert(0, os.path.dirname(__file__))
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+import io_uring_loop
+from app import TreeDBApplication
+from config.settings import config
+from services.database_service import database_service
+from services.session_service import session_service
+from handlers.api import APIHandler, STATIC_COPY_BUFFER_SIZE
+from utils.helpers import (
+    parse_content_length, request_body_limit, build_payload_too_large_response
+)
+
+
+# 请求体超过上限时直接返回的完整 413 响应
+PAYLOAD_TOO_LARGE_RESPONSE = build_payload_too_large_response()
+
+
+class BufferedAPIHandler(APIHandler):
+    """基于内存缓冲区的API处理器 - 从字节读取请求，把响应写入字节"""
+
+    # 每个连接只处理一个请求，告知客户端不要复用连接
+    protocol_version = 'HTTP/1.0'
+
+    def __init__(self, request_bytes: bytes, client_address):
+        self._request_bytes = request_bytes
+        super().__init__(None, client_address, None)
+
+    def setup(self):
+        """使用内存缓冲区代替套接字文件"""
+        self.rfile = io.BytesIO(self._request_bytes)
+        self.wfile = io.BytesIO()
+        self.pending_file: Optional[Tuple[BinaryIO, int]] = None
+
+    def finish(self):
+        """保留 wfile 内容供调用方读取"""
+        pass
+
+    def _send_file(self, f, size: int):
+        """不复制文件内容，记录文件供调用方在响应头之后直接发送"""
+        self.pending_file = (os.fdopen(os.dup(f.fileno()), 'rb'), size)
+
+    @classmethod
+    def process_streaming(cls, request_bytes: bytes, client_address
+                          ) -> Tuple[bytes, Optional[Tuple[BinaryIO, int]]]:
+        """处理一个完整的HTTP请求，返回响应字节及其后待发送的文件（调用方负责关闭）"""
+        handler = cls(request_bytes, client_address)
+        return handler.wfile.getvalue(), handler.pending_file
+
+    @classmethod
+    def process(cls, request_bytes: bytes, client_address) -> bytes:
+        """处理一个完整的HTTP请求并返回完整的响应字节"""
+        response, pending_file = cls.process_streaming(request_bytes, client_address)
+        if pending_file is not None:
+            f, size = pending_file
+            with f:
+                response += f.read(size)
+        return response
+
+
+class AsyncTreeDBApplication(TreeDBApplication):
+    """异步TreeDB应用 - 单一职责：在事件循环上管理应用生命周期"""
+
+    def __init__(self):
+        super().__init__()
+        self.loop = None
+        self.io_pool = None
+        self._semaphore = None
+        self._cleanup_task = None
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理单个连接上的一个请求"""
+        peer = writer.get_extra_info('peername') or ('', 0)
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = parse_content_length(head)
+            if length < 0:
+                raise ValueError('Invalid Content-Length')
+            # 超过该路由上限的请求体不读入内存，直接返回 413，不把截断的请求交给处理器
+            if length > request_body_limit(head):
+                writer.write(PAYLOAD_TOO_LARGE_RESPONSE)
+                await writer.drain()
+                return
+            body = await reader.readexactly(length) if length else b''
+
+            async with self._semaphore:
+                response, pending_file = await self.loop.run_in_executor(
+                    self.io_pool, BufferedAPIHandler.process_streaming, head + body, peer
+                )
+
+            writer.write(response)
+            if pending_file is not None:
+                f, size = pending_file
+                with f:
+                    await self._send_file(writer, f, size)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _send_file(self, writer: asyncio.StreamWriter, f: BinaryIO, size: int):
+        """发送响应头之后的大静态文件
+
+        标准 asyncio 事件循环用 sendfile 直接写入套接字；uvloop 等未实现 sendfile 的事件循环
+        （抛出 NotImplementedError/RuntimeError）回退为在线程池中分块读取、逐块写入。
+        """
+        if isinstance(self.loop, asyncio.BaseEventLoop):
+            try:
+                await self.loop.sendfile(writer.transport, f, 0, size)
+                return
+            except (NotImplementedError, RuntimeError):
+                f.seek(0)
+
+        remaining = size
+        while remaining > 0:
+            chunk = await self.loop.run_in_executor(
+                self.io_pool, f.read, min(STATIC_COPY_BUFFER_SIZE, remaining)
+            )
+            if not chunk:
+                break
+            writer.write(chunk)
+            await writer.drain()
+            remaining -= len(chunk)
+
+    async def cleanup_coro(self):
+        """会话清理协程：等待与批量清理都在线程中完成，事件循环不会阻塞在会话锁上"""
+        while self.running:
+            try:
+                await asyncio.to_thread(session_service.run_expiry_cycle)
+            except Exception as e:
+                print(f"Cleanup worker error: {e}")
+                await asyncio.sleep(1)
+
+    async def serve(self):
+        """启动服务器并一直运行"""
+        self.loop = asyncio.get_running_loop()
+        # 请求处理（数据库I/O）使用独立线程池，会话清理的长时间等待留在默认线程池，互不占用。
+        # 只有事件循环线程向该线程池提交任务，标准线程池的 SimpleQueue 不存在多生产者竞争，
+        # 因此不需要工作窃取式线程池
+        self.io_pool = ThreadPoolExecutor(
+            max_workers=config.MAX_WORKERS, thread_name_prefix='treedb-io'
+        )
+        self._semaphore = asyncio.Semaphore(config.MAX_WORKERS)
+        self._cleanup_task = asyncio.create_task(self.cleanup_coro())
+        self.server = await asyncio.start_server(self.handle, config.host, config.port)
+
+        print(f"\nServer listening on http://{config.host}:{config.port}")
+        print(f"Event loop: {'uvloop' if uvloop else 'asyncio'}")
+        print("Press Ctrl+C to stop\n")
+
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        except asyncio.CancelledError:
+            # stop() 关闭服务器引起的取消属于正常退出；Ctrl+C 等其他取消继续向上抛出
+            if self.running:
+                raise
+        finally:
+            # 先唤醒清理线程，否则关闭默认线程池时会一直等待
+            self.running = False
+            session_service.wake_cleanup_worker()
+            self.io_pool.shutdown(wait=False)
+
+    def serve_io_uring(self):
+        """使用 io_uring 后端运行服务器，会话清理使用清理线程"""
+        self.start_cleanup_worker()
+        self.server = io_uring_loop.IoUringServer(
+            config.host, config.port, BufferedAPIHandler.process, config.MAX_WORKERS
+        )
+
+        print(f"\nServer listening on http://{config.host}:{config.port}")
+        print("Event loop: io_uring")
+        print("Press Ctrl+C to stop\n")
+
+        self.server.serve_forever()
+
+    def run(self):
+        """运行应用"""
+        loop_factory = uvloop.new_event_loop if uvloop else None
+        try:
+            self.initialize()
+            self.running = True
+            self.start_optimize_worker()
+            if io_uring_loop.is_available():
+                self.serve_io_uring()
+                return
+            with asyncio.Runner(loop_factory=loop_factory) as runner:
+                runner.run(self.serve())
+        except KeyboardInterrupt:
+            print("\nShutting down server...")
+            self.stop()
+        except Exception as e:
+            print(f"Server error: {e}")
+            self.stop()
+            sys.exit(1)
+
+    def stop(self):
+        """停止应用"""
+        self.running = False
+        self._stopped.set()
+        session_service.wake_cleanup_worker()
+        if isinstance(self.server, io_uring_loop.IoUringServer):
+            self.server.shutdown()
+        elif self.server and self.loop and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.server.close)
+        # 事件循环已退出时等待线程池中仍在处理的请求结束，它们归还连接后再关闭连接池
+        if self.io_pool is not None and not (self.loop and self.loop.is_running()):
+            self.io_pool.shutdown(wait=True)
+        self.optimize_database()
+        database_service.close_connections()
+        print("Server stopped")
+
+
+def main():
+    """主函数"""
+    app = AsyncTreeDBApplication()
+    app.run()
+
+
+if __name__ == '__main__':
+    main()
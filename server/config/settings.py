@@ -5,18 +5,18 @@ Settings Module - 配置管理模块
 """
 
 import os
-import copy
 import socket
 from pathlib import Path
 from threading import RLock
-from typing import Dict, Any, Optional
+from types import MappingProxyType
+from typing import Dict, Any, Optional, Mapping
 from contextlib import contextmanager
 
 
 class ConfigManager:
     """配置管理器 - 单一职责：管理应用配置"""
 
-    def __init__(self):
+    def __init__(self) -> None:
         # 基础路径配置
         self.BASE_DIR = Path(__file__).resolve().parent.parent.parent
         self.STATIC_DIR = self.BASE_DIR / 'public'
@@ -27,7 +27,7 @@ class ConfigManager:
         self.ALLOWED_DB_EXTENSIONS = {'.db', '.sqlite', '.sqlite3', '.sqlite2'}
 
         # 默认配置
-        self._config = {
+        default_config = {
             'DB_PATH': str(Path(os.environ.get('DB_PATH', self.DEFAULT_DB_PATH)).resolve()),
             'TABLE_NAME': os.environ.get('TABLE_NAME', 'tree_nodes'),
             'ID_FIELD': os.environ.get('ID_FIELD', 'id'),
@@ -37,11 +37,18 @@ class ConfigManager:
 
         # 服务器配置
         self.HOST = os.environ.get('HOST', '127.0.0.1')
-        # 如果指定了端口则使用，否则自动查找可用端口
+        # 如果指定了端口则使用，否则优先使用3000，被占用时由系统分配
         if 'PORT' in os.environ:
             self.PORT = int(os.environ.get('PORT'))
         else:
-            self.PORT = self._find_available_port(3000, 3999)
+            self.PORT = self._find_available_port(3000)
+        # 异步服务器同时执行的请求处理线程上限
+        self.MAX_WORKERS = int(os.environ.get('MAX_WORKERS', '32'))
+        # 线程服务器同时服务的连接上限（持久连接在空闲期间也占用一个线程）
+        self.MAX_CONNECTIONS = int(os.environ.get('MAX_CONNECTIONS', '256'))
+
+        # 定期执行 PRAGMA optimize 的间隔（秒），0 表示只在启动和停止时执行
+        self.OPTIMIZE_INTERVAL_SECONDS = int(os.environ.get('OPTIMIZE_INTERVAL_SECONDS', '14400'))
 
         # 会话配置
         self.SESSION_TIMEOUT_SECONDS = int(os.environ.get('SESSION_TIMEOUT_SECONDS', '1800'))
@@ -52,31 +59,37 @@ class ConfigManager:
         self.BOOLEAN_TYPE_HINTS = {'BOOLEAN', 'BOOL'}
         self.TRUTHY_STRINGS = {'true', '1', 'yes', 'y', 'on'}
         self.FALSY_STRINGS = {'false', '0', 'no', 'n', 'off'}
+        # 小写布尔字符串 -> 布尔值，一次字典查找同时判断真值与假值
+        self.BOOL_STRINGS: Dict[str, bool] = {
+            **{text: True for text in self.TRUTHY_STRINGS},
+            **{text: False for text in self.FALSY_STRINGS},
+        }
 
         # 运行时配置
-        self.COLUMN_TYPES = {}
-        self.FOREIGN_KEYS = {}
-        self.COLUMN_INFO = {}
+        self.COLUMN_TYPES: Dict[str, str] = {}
+        self.FOREIGN_KEYS: Dict[str, Dict[str, str]] = {}
+        self.COLUMN_INFO: Dict[str, Any] = {}
 
-        # 锁
+        # 写锁：只用于串行化并发写入，读取不加锁
         self._lock = RLock()
 
-        # 初始化运行时变量
-        self._refresh_runtime_variables()
+        # 配置采用写时复制：_config 是只读映射，写入时整体替换引用
+        self._config: Mapping[str, Any] = MappingProxyType({})
+        # 字符串形式的配置快照，在写入时预先计算
+        self._snapshot: Dict[str, str] = {}
+        self._publish_config(default_config)
 
-    def get_config_internal(self) -> Dict[str, Any]:
-        """获取内部配置"""
-        with self._lock:
-            return copy.deepcopy(self._config)
+    def get_config_internal(self) -> Mapping[str, Any]:
+        """获取内部配置（只读映射，无需复制）"""
+        return self._config
 
     def get_config_snapshot(self) -> Dict[str, Any]:
-        """获取配置快照"""
-        with self._lock:
-            return self.build_config_snapshot(self._config)
+        """获取配置快照（写入时预先计算，调用方不应修改返回值）"""
+        return self._snapshot
 
-    def build_config_snapshot(self, cfg: Dict[str, Any]) -> Dict[str, Any]:
+    def build_config_snapshot(self, cfg: Mapping[str, Any]) -> Dict[str, Any]:
         """构建配置快照"""
-        snapshot = {}
+        snapshot: Dict[str, str] = {}
         for key, value in cfg.items():
             if isinstance(value, bool):
                 snapshot[key] = str(value).lower()
@@ -84,21 +97,31 @@ class ConfigManager:
                 snapshot[key] = str(value)
         return snapshot
 
-    def apply_config_updates(self, new_config: Dict[str, Any]) -> None:
-        """应用配置更新"""
-        with self._lock:
-            self._config.update(new_config)
-            self._refresh_runtime_variables()
+    def apply_config_updates(self, new_config: Dict[str, Any]) -> bool:
+        """应用配置更新，返回配置是否发生变化
 
-    def _refresh_runtime_variables(self) -> None:
-        """刷新运行时变量"""
-        normalized_db_path = self.normalize_db_path(self._config.get('DB_PATH'))
-        self._config['DB_PATH'] = normalized_db_path
+        合并后的配置与当前配置相同时不重新发布，配置快照保持同一对象。
+        """
+        with self._lock:
+            merged = {**self._config, **new_config}
+            merged['DB_PATH'] = self.normalize_db_path(merged.get('DB_PATH'))
+            if merged == self._config:
+                return False
+            self._publish_config(merged)
+            return True
+
+    def _publish_config(self, new_config: Dict[str, Any]) -> None:
+        """规范化新配置，原子替换 _config 引用并刷新运行时变量（调用方需持有写锁或处于初始化阶段）"""
+        normalized_db_path = self.normalize_db_path(new_config.get('DB_PATH'))
+        new_config['DB_PATH'] = normalized_db_path
+        self._config = MappingProxyType(new_config)
+        self._snapshot = self.build_config_snapshot(new_config)
         self.DB_PATH = Path(normalized_db_path)
-        self.TABLE_NAME = self._config['TABLE_NAME']
-        self.ID_FIELD = self._config['ID_FIELD']
-        self.PARENT_FIELD = self._config['PARENT_FIELD']
-        self.AUTO_BOOTSTRAP = self._config.get('AUTO_BOOTSTRAP', False)
+        self.DB_PATH_STR = normalized_db_path
+        self.TABLE_NAME = new_config['TABLE_NAME']
+        self.ID_FIELD = new_config['ID_FIELD']
+        self.PARENT_FIELD = new_config['PARENT_FIELD']
+        self.AUTO_BOOTSTRAP = new_config.get('AUTO_BOOTSTRAP', False)
 
     def update_server_config(self, new_config: Dict[str, Any]) -> Dict[str, Any]:
         """更新服务器配置"""
@@ -119,7 +142,7 @@ class ConfigManager:
                 path = path.resolve()
         return str(path)
 
-    def make_resource_key(self, config: Optional[Dict[str, Any]] = None) -> tuple:
+    def make_resource_key(self, config: Optional[Mapping[str, Any]] = None) -> tuple:
         """创建资源键"""
         if config is None:
             config = self._config
@@ -130,6 +153,11 @@ class ConfigManager:
         """获取数据库路径"""
         return self.DB_PATH
 
+    @property
+    def db_path_str(self) -> str:
+        """获取数据库路径字符串（配置发布时计算一次，作为连接池的键）"""
+        return self.DB_PATH_STR
+
     @property
     def table_name(self) -> str:
         """获取表名"""
@@ -160,22 +188,19 @@ class ConfigManager:
         if isinstance(value, bool):
             return value
         if isinstance(value, str):
-            return value.lower().strip() in self.TRUTHY_STRINGS
+            return self.BOOL_STRINGS.get(value.strip().lower(), False)
         if isinstance(value, (int, float)):
             return value != 0
         return False
 
-    def _find_available_port(self, start: int, end: int) -> int:
-        """查找可用端口"""
-        for port in range(start, end + 1):
+    def _find_available_port(self, preferred: int) -> int:
+        """查找可用端口：优先使用 preferred，被占用时绑定端口0由系统分配空闲端口"""
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
             try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                    sock.bind((self.HOST, port))
-                    return port
+                sock.bind((self.HOST, preferred))
             except OSError:
-                continue
-        # 如果没有找到可用端口，抛出异常
-        raise RuntimeError(f"No available ports found between {start} and {end}")
+                sock.bind((self.HOST, 0))
+            return sock.getsockname()[1]
 
 
 # 全局配置实例
@@ -6,15 +6,82 @@ TreeDB Core Service
 
 import sqlite3
 import json
+import queue
+import re
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Union, Callable, Tuple, Iterator
 from contextlib import contextmanager
-from datetime import datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# 逐批读取全部节点时每批的行数
+NODE_BATCH_SIZE = 1000
+
+# 允许的表名：字母或下划线开头，最长64个字符
+TABLE_NAME_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]{0,63}')
+
+
+def quote_ident(name: str) -> str:
+    """引用SQL标识符"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+@lru_cache(maxsize=64)
+def quote_table_name(table_name: str) -> str:
+    """
+    校验并引用表名
+
+    只有通过校验的表名才会进入SQL文本及其缓存。
+
+    Args:
+        table_name: 表名
+
+    Returns:
+        str: 引用后的表名
+
+    Raises:
+        ValidationError: 表名不合法
+    """
+    if not TABLE_NAME_PATTERN.fullmatch(table_name):
+        raise ValidationError(f'Invalid table name: {table_name!r}')
+    return quote_ident(table_name)
+
+
+def fetch_dicts(cursor: sqlite3.Cursor) -> List[Dict[str, Any]]:
+    """
+    以元组行取回全部结果并转换为字典
+
+    列名只从 cursor.description 读取一次，用 zip 构建字典，
+    不再为每行创建 sqlite3.Row 后再 dict(row)。调用方需在执行前把游标的 row_factory 设为 None。
+
+    Args:
+        cursor: 已执行查询的游标
+
+    Returns:
+        List[Dict[str, Any]]: 行字典列表
+    """
+    rows = cursor.fetchall()
+    if cursor.description is None:
+        return []
+    columns = [description[0] for description in cursor.description]
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def dumps_json(data: Any) -> str:
+    """序列化为JSON文本，安装了 orjson 时使用 orjson"""
+    if orjson is not None:
+        return orjson.dumps(data).decode('utf-8')
+    return json.dumps(data, ensure_ascii=False)
 
 
 class TreeDBError(Exception):
     """TreeDB基础异常类"""
-    def __init__(self, message: str, code: int = 500):
+    def __init__(self, message: str, code: int = 500) -> None:
         super().__init__(message)
         self.code = code
         self.message = message
@@ -22,19 +89,19 @@ class TreeDBError(Exception):
 
 class ValidationError(TreeDBError):
     """数据验证错误"""
-    def __init__(self, message: str):
+    def __init__(self, message: str) -> None:
         super().__init__(message, 400)
 
 
 class DatabaseError(TreeDBError):
     """数据库操作错误"""
-    def __init__(self, message: str):
+    def __init__(self, message: str) -> None:
         super().__init__(message, 500)
 
 
 class NotFoundError(TreeDBError):
     """资源未找到错误"""
-    def __init__(self, message: str = 'Resource not found'):
+    def __init__(self, message: str = 'Resource not found') -> None:
         super().__init__(message, 404)
 
 
@@ -44,36 +111,117 @@ class TreeDBService:
     单一职责：提供树形数据的CRUD操作
     """
 
-    def __init__(self, db_path: Union[str, Path]):
+    # 新建连接时执行的PRAGMA
+    CONNECTION_PRAGMAS = (
+        "PRAGMA journal_mode = WAL",
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA temp_store = MEMORY",
+        "PRAGMA mmap_size = 268435456",
+        "PRAGMA cache_size = -65536",
+    )
+
+    def __init__(self, db_path: Union[str, Path], pool_size: int = 8) -> None:
         """
         初始化服务
 
         Args:
             db_path: 数据库文件路径
+            pool_size: 每个数据库文件保留的空闲连接数上限
         """
         self.db_path = Path(db_path)
-        self._table_cache = {}
+        self._table_cache: Dict[str, Dict[str, Any]] = {}
+        self._pool_size = pool_size
+        self._pools: Dict[str, 'queue.Queue[sqlite3.Connection]'] = {}
+        # SQL文本缓存，键为 (操作, 表名, 列元组)
+        self._stmt_cache: Dict[Tuple[Any, ...], str] = {}
+
+    def _open_connection(self, path: str) -> sqlite3.Connection:
+        """
+        创建新的数据库连接并应用PRAGMA
+
+        Args:
+            path: 数据库文件路径
+
+        Returns:
+            sqlite3.Connection: 数据库连接对象
+        """
+        # isolation_level=None：由写操作显式 BEGIN IMMEDIATE，避免隐式事务开销
+        conn = sqlite3.connect(
+            path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=256
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in self.CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _acquire_connection(self, path: str) -> sqlite3.Connection:
+        """从连接池获取连接，池为空时新建"""
+        pool = self._pools.get(path)
+        if pool is None:
+            pool = self._pools.setdefault(path, queue.Queue(maxsize=self._pool_size))
+        try:
+            return pool.get_nowait()
+        except queue.Empty:
+            return self._open_connection(path)
+
+    def _release_connection(self, path: str, conn: sqlite3.Connection) -> None:
+        """将连接归还连接池，池已满时关闭连接"""
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._pools[path].put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self) -> None:
+        """关闭连接池中的所有空闲连接"""
+        for pool in self._pools.values():
+            while True:
+                try:
+                    pool.get_nowait().close()
+                except queue.Empty:
+                    break
+
+    def _get_sql(self, key: Tuple[Any, ...], build: Callable[[], str]) -> str:
+        """
+        获取缓存的SQL文本，未命中时构建并缓存
+
+        Args:
+            key: 缓存键 (操作, 表名, 列元组)
+            build: 构建SQL文本的函数
+
+        Returns:
+            str: SQL文本
+        """
+        sql = self._stmt_cache.get(key)
+        if sql is None:
+            sql = self._stmt_cache.setdefault(key, build())
+        return sql
 
     @contextmanager
-    def get_connection(self, db_path: Optional[Path] = None):
+    def get_connection(self, db_path: Optional[Path] = None) -> Iterator[sqlite3.Connection]:
         """
         获取数据库连接上下文管理器
 
+        连接来自连接池，使用完毕后归还而不是关闭。
+
         Args:
             db_path: 可选的数据库路径，默认使用初始化时的路径
 
         Yields:
             sqlite3.Connection: 数据库连接对象
         """
-        path = db_path or self.db_path
-        conn = sqlite3.connect(str(path), check_same_thread=False)
-        conn.row_factory = sqlite3.Row
+        path = str(db_path or self.db_path)
+        conn = self._acquire_connection(path)
         try:
             yield conn
         except sqlite3.Error as e:
             raise DatabaseError(f'Database operation failed: {str(e)}')
         finally:
-            conn.close()
+            self._release_connection(path, conn)
 
     def _ensure_table_exists(self, table_name: str, conn: sqlite3.Connection) -> None:
         """
@@ -87,6 +235,8 @@ class TreeDBService:
         if table_name in self._table_cache:
             return
 
+        table = quote_table_name(table_name)
+
         # 检查表是否存在
         cursor = conn.cursor()
         cursor.execute(
@@ -98,19 +248,53 @@ class TreeDBService:
         if not cursor.fetchone():
             # 创建基础表结构
             cursor.execute(f'''
-                CREATE TABLE {table_name} (
+                CREATE TABLE {table} (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     parent_id INTEGER,
                     name TEXT NOT NULL,
+                    sort_order INTEGER DEFAULT 0,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (parent_id) REFERENCES {table_name}(id) ON DELETE CASCADE
+                    FOREIGN KEY (parent_id) REFERENCES {table}(id) ON DELETE CASCADE
                 )
             ''')
             conn.commit()
 
-        # 缓存表信息
-        self._table_cache[table_name] = True
+        # 缓存表信息（列名集合），表结构变更时通过 invalidate_table 失效
+        cursor.execute(f"PRAGMA table_info({table})")
+        column_order = tuple(row['name'] for row in cursor.fetchall())
+        columns = frozenset(column_order)
+        self._table_cache[table_name] = {'columns': columns, 'column_order': column_order}
+
+        # ORDER BY sort_order, name 走索引扫描，避免每次查询排序
+        if {'parent_id', 'sort_order', 'name'} <= columns:
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {quote_ident(f'idx_{table_name}_parent_sort')} "
+                f"ON {table} (parent_id, sort_order, name)"
+            )
+        if {'sort_order', 'name'} <= columns:
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {quote_ident(f'idx_{table_name}_sort')} "
+                f"ON {table} (sort_order, name)"
+            )
+
+        # updated_at 由触发器维护，写操作无需在Python中生成时间戳
+        if {'id', 'updated_at'} <= columns:
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {quote_ident(f'{table_name}_updated_at')} "
+                f"AFTER UPDATE ON {table} BEGIN "
+                f"UPDATE {table} SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id; "
+                f"END"
+            )
+
+    def invalidate_table(self, table_name: str) -> None:
+        """
+        使表信息缓存失效，在表结构变更（ALTER TABLE等）后调用
+
+        Args:
+            table_name: 表名
+        """
+        self._table_cache.pop(table_name, None)
 
     def _validate_fields(self, data: Dict[str, Any], table_name: str,
                         conn: sqlite3.Connection) -> Dict[str, Any]:
@@ -125,16 +309,12 @@ class TreeDBService:
         Returns:
             Dict[str, Any]: 清理后的数据
         """
-        # 获取表结构
-        cursor = conn.cursor()
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        columns = {row['name'] for row in cursor.fetchall()}
+        # 获取缓存的表结构
+        self._ensure_table_exists(table_name, conn)
+        columns = self._table_cache[table_name]['columns']
 
         # 清理数据，只保留表中的字段
-        cleaned_data = {}
-        for key, value in data.items():
-            if key in columns:
-                cleaned_data[key] = value
+        cleaned_data = {key: value for key, value in data.items() if key in columns}
 
         # 验证必需字段
         if 'name' in columns and not cleaned_data.get('name'):
@@ -152,13 +332,73 @@ class TreeDBService:
         Returns:
             List[Dict[str, Any]]: 节点列表
         """
+        return list(self.iter_all_nodes(table_name))
+
+    def iter_all_nodes(self, table_name: str = 'tree_nodes',
+                       batch_size: int = NODE_BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+        """
+        逐行获取所有节点数据
+
+        按批 fetchmany 并转换为字典，不会同时持有全部元组行与全部字典两份结果；
+        迭代结束（或生成器关闭）前连接不归还连接池。
+
+        Args:
+            table_name: 表名，默认为 'tree_nodes'
+            batch_size: 每批读取的行数
+
+        Yields:
+            Dict[str, Any]: 节点数据
+        """
         with self.get_connection() as conn:
             self._ensure_table_exists(table_name, conn)
 
+            sql = self._get_sql(
+                ('select_all', table_name),
+                lambda: f"SELECT * FROM {quote_table_name(table_name)} ORDER BY sort_order, name"
+            )
             cursor = conn.cursor()
-            cursor.execute(f"SELECT * FROM {table_name} ORDER BY sort_order, name")
+            cursor.row_factory = None
+            cursor.execute(sql)
+            columns = [description[0] for description in cursor.description]
 
-            return [dict(row) for row in cursor.fetchall()]
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from [dict(zip(columns, row)) for row in rows]
+
+    def get_all_nodes_json(self, table_name: str = 'tree_nodes') -> str:
+        """
+        获取所有节点数据的JSON文本
+
+        SQLite >= 3.38 时由 json1 直接在数据库中生成JSON数组，
+        省去逐行构建字典再序列化的开销；否则回退到 get_all_nodes。
+
+        Args:
+            table_name: 表名，默认为 'tree_nodes'
+
+        Returns:
+            str: 节点列表的JSON文本
+        """
+        if sqlite3.sqlite_version_info < (3, 38):
+            return dumps_json(self.get_all_nodes(table_name))
+
+        with self.get_connection() as conn:
+            self._ensure_table_exists(table_name, conn)
+            column_order = self._table_cache[table_name]['column_order']
+
+            def build() -> str:
+                pairs: List[str] = []
+                for column in column_order:
+                    key = column.replace("'", "''")
+                    pairs.append(f"'{key}', {quote_ident(column)}")
+                return (
+                    f"SELECT json_group_array(json_object({', '.join(pairs)})) "
+                    f"FROM (SELECT * FROM {quote_table_name(table_name)} ORDER BY sort_order, name)"
+                )
+
+            sql = self._get_sql(('select_all_json', table_name, column_order), build)
+            return conn.execute(sql).fetchone()[0]
 
     def get_node_by_id(self, node_id: int, table_name: str = 'tree_nodes') -> Optional[Dict[str, Any]]:
         """
@@ -174,11 +414,12 @@ class TreeDBService:
         with self.get_connection() as conn:
             self._ensure_table_exists(table_name, conn)
 
-            cursor = conn.cursor()
-            cursor.execute(
-                f"SELECT * FROM {table_name} WHERE id = ?",
-                (node_id,)
+            sql = self._get_sql(
+                ('select_one', table_name),
+                lambda: f"SELECT * FROM {quote_table_name(table_name)} WHERE id = ?"
             )
+            cursor = conn.cursor()
+            cursor.execute(sql, (node_id,))
 
             row = cursor.fetchone()
             return dict(row) if row else None
@@ -197,28 +438,77 @@ class TreeDBService:
         with self.get_connection() as conn:
             self._ensure_table_exists(table_name, conn)
 
-            # 验证和清理数据
+            # 验证和清理数据（created_at/updated_at 使用列默认值 CURRENT_TIMESTAMP）
             data = self._validate_fields(data, table_name, conn)
 
-            # 添加时间戳
-            data['created_at'] = datetime.now().isoformat()
-            data['updated_at'] = datetime.now().isoformat()
-
-            # 构建SQL
-            columns = list(data.keys())
-            placeholders = ', '.join(['?' for _ in columns])
-            values = list(data.values())
+            # 构建SQL（列名排序，使相同结构的数据复用同一条SQL）
+            columns = tuple(sorted(data.keys()))
+            sql = self._insert_sql(table_name, columns)
+            values = [data[column] for column in columns]
 
             cursor = conn.cursor()
-            cursor.execute(
-                f"INSERT INTO {table_name} ({', '.join(columns)}) "
-                f"VALUES ({placeholders})",
-                values
-            )
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(sql, values)
 
             conn.commit()
             return cursor.lastrowid
 
+    def create_nodes(self, rows: List[Dict[str, Any]], table_name: str = 'tree_nodes') -> List[int]:
+        """
+        在一个事务中批量创建节点
+
+        相同字段集合的数据共用一条INSERT语句，通过 executemany 批量执行。
+
+        Args:
+            rows: 节点数据列表
+            table_name: 表名
+
+        Returns:
+            List[int]: 新创建节点的ID，顺序与输入一致
+        """
+        if not rows:
+            return []
+
+        with self.get_connection() as conn:
+            self._ensure_table_exists(table_name, conn)
+
+            # 验证数据并按字段集合分组
+            groups: Dict[Tuple[str, ...], List[Tuple[int, Dict[str, Any]]]] = {}
+            for index, data in enumerate(rows):
+                data = self._validate_fields(data, table_name, conn)
+                groups.setdefault(tuple(sorted(data.keys())), []).append((index, data))
+
+            ids: List[int] = [0] * len(rows)
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            for columns, members in groups.items():
+                cursor.executemany(
+                    self._insert_sql(table_name, columns),
+                    [[data[column] for column in columns] for _, data in members]
+                )
+
+                if 'id' in columns:
+                    for index, data in members:
+                        ids[index] = data['id']
+                else:
+                    # 写事务内自动生成的rowid连续递增
+                    last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+                    first_id = last_id - len(members) + 1
+                    for offset, (index, _) in enumerate(members):
+                        ids[index] = first_id + offset
+
+            conn.commit()
+            return ids
+
+    def _insert_sql(self, table_name: str, columns: Tuple[str, ...]) -> str:
+        """获取指定列的INSERT语句"""
+        return self._get_sql(
+            ('insert', table_name, columns),
+            lambda: f"INSERT INTO {quote_table_name(table_name)} "
+                    f"({', '.join([quote_ident(column) for column in columns])}) "
+                    f"VALUES ({', '.join(['?' for _ in columns])})"
+        )
+
     def update_node(self, node_id: int, data: Dict[str, Any],
                    table_name: str = 'tree_nodes') -> bool:
         """
@@ -233,29 +523,45 @@ class TreeDBService:
             bool: 是否更新成功
         """
         with self.get_connection() as conn:
-            self._ensure_table_exists(table_name, conn)
+            return self._update_node(conn, node_id, data, table_name)
 
-            # 验证和清理数据
-            data = self._validate_fields(data, table_name, conn)
+    def _update_node(self, conn: sqlite3.Connection, node_id: int,
+                     data: Dict[str, Any], table_name: str) -> bool:
+        """
+        在给定连接上更新节点
 
-            if not data:
-                return False
+        Args:
+            conn: 数据库连接
+            node_id: 节点ID
+            data: 更新的数据
+            table_name: 表名
 
-            # 添加更新时间戳
-            data['updated_at'] = datetime.now().isoformat()
+        Returns:
+            bool: 是否更新成功
+        """
+        self._ensure_table_exists(table_name, conn)
 
-            # 构建SQL
-            set_clause = ', '.join([f"{key} = ?" for key in data.keys()])
-            values = list(data.values()) + [node_id]
+        # 验证和清理数据
+        data = self._validate_fields(data, table_name, conn)
 
-            cursor = conn.cursor()
-            cursor.execute(
-                f"UPDATE {table_name} SET {set_clause} WHERE id = ?",
-                values
-            )
+        if not data:
+            return False
 
-            conn.commit()
-            return cursor.rowcount > 0
+        # 构建SQL（updated_at 由触发器更新）
+        columns = tuple(sorted(data.keys()))
+        sql = self._get_sql(
+            ('update', table_name, columns),
+            lambda: f"UPDATE {quote_table_name(table_name)} SET "
+                    f"{', '.join([f'{quote_ident(key)} = ?' for key in columns])} WHERE id = ?"
+        )
+        values = [data[column] for column in columns] + [node_id]
+
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(sql, values)
+
+        conn.commit()
+        return cursor.rowcount > 0
 
     def delete_node(self, node_id: int, table_name: str = 'tree_nodes') -> bool:
         """
@@ -272,11 +578,13 @@ class TreeDBService:
             self._ensure_table_exists(table_name, conn)
 
             # SQLite的ON DELETE CASCADE会自动删除子节点
-            cursor = conn.cursor()
-            cursor.execute(
-                f"DELETE FROM {table_name} WHERE id = ?",
-                (node_id,)
+            sql = self._get_sql(
+                ('delete', table_name),
+                lambda: f"DELETE FROM {quote_table_name(table_name)} WHERE id = ?"
             )
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(sql, (node_id,))
 
             conn.commit()
             return cursor.rowcount > 0
@@ -296,7 +604,7 @@ class TreeDBService:
 
             # 获取表结构
             cursor = conn.cursor()
-            cursor.execute(f"PRAGMA table_info({table_name})")
+            cursor.execute(f"PRAGMA table_info({quote_table_name(table_name)})")
             columns = [dict(row) for row in cursor.fetchall()]
 
             # 识别主键和外键字段
@@ -335,19 +643,23 @@ class TreeDBService:
             self._ensure_table_exists(table_name, conn)
 
             cursor = conn.cursor()
+            cursor.row_factory = None
             if parent_id is None:
-                cursor.execute(
-                    f"SELECT * FROM {table_name} "
-                    f"WHERE parent_id IS NULL ORDER BY sort_order, name"
+                sql = self._get_sql(
+                    ('select_roots', table_name),
+                    lambda: f"SELECT * FROM {quote_table_name(table_name)} "
+                            f"WHERE parent_id IS NULL ORDER BY sort_order, name"
                 )
+                cursor.execute(sql)
             else:
-                cursor.execute(
-                    f"SELECT * FROM {table_name} "
-                    f"WHERE parent_id = ? ORDER BY sort_order, name",
-                    (parent_id,)
+                sql = self._get_sql(
+                    ('select_children', table_name),
+                    lambda: f"SELECT * FROM {quote_table_name(table_name)} "
+                            f"WHERE parent_id = ? ORDER BY sort_order, name"
                 )
+                cursor.execute(sql, (parent_id,))
 
-            return [dict(row) for row in cursor.fetchall()]
+            return fetch_dicts(cursor)
 
     def move_node(self, node_id: int, new_parent_id: Optional[int],
                   table_name: str = 'tree_nodes') -> bool:
@@ -362,46 +674,46 @@ class TreeDBService:
         Returns:
             bool: 是否移动成功
         """
-        # 检查是否会形成循环
-        if new_parent_id is not None and self._would_create_cycle(
-            node_id, new_parent_id, table_name
-        ):
-            raise ValidationError('Cannot move node: would create a cycle')
+        with self.get_connection() as conn:
+            self._ensure_table_exists(table_name, conn)
+
+            # 检查是否会形成循环
+            if new_parent_id is not None and self._would_create_cycle(
+                node_id, new_parent_id, table_name, conn
+            ):
+                raise ValidationError('Cannot move node: would create a cycle')
 
-        return self.update_node(node_id, {'parent_id': new_parent_id}, table_name)
+            return self._update_node(conn, node_id, {'parent_id': new_parent_id}, table_name)
 
-    def _would_create_cycle(self, node_id: int, parent_id: int,
-                           table_name: str, visited: Optional[set] = None) -> bool:
+    def _would_create_cycle(self, node_id: int, parent_id: int, table_name: str,
+                           conn: Optional[sqlite3.Connection] = None) -> bool:
         """
         检查移动节点是否会形成循环
 
+        通过递归CTE一次查询目标父节点的祖先链，判断其中是否包含要移动的节点。
+
         Args:
             node_id: 要移动的节点ID
             parent_id: 目标父节点ID
             table_name: 表名
-            visited: 已访问的节点ID集合
+            conn: 可选的数据库连接，默认新建连接
 
         Returns:
             bool: 是否会形成循环
         """
-        if visited is None:
-            visited = set()
-
-        if node_id in visited:
-            return True
-
-        visited.add(node_id)
-
-        # 获取父节点的所有祖先
-        current_parent = parent_id
-        while current_parent is not None:
-            if current_parent == node_id:
-                return True
-
-            parent_data = self.get_node_by_id(current_parent, table_name)
-            if not parent_data:
-                break
-
-            current_parent = parent_data.get('parent_id')
-
-        return False
\ No newline at end of file
+        if conn is None:
+            with self.get_connection() as conn:
+                return self._would_create_cycle(node_id, parent_id, table_name, conn)
+
+        # 使用 UNION 而不是 UNION ALL，数据中已存在环时也能终止
+        sql = self._get_sql(
+            ('ancestors', table_name),
+            lambda: f"WITH RECURSIVE anc(id, pid) AS ("
+                    f"SELECT id, parent_id FROM {quote_table_name(table_name)} WHERE id = ? "
+                    f"UNION SELECT t.id, t.parent_id FROM {quote_table_name(table_name)} t "
+                    f"JOIN anc ON t.id = anc.pid"
+                    f") SELECT 1 FROM anc WHERE id = ? LIMIT 1"
+        )
+        cursor = conn.cursor()
+        cursor.execute(sql, (parent_id, node_id))
+        return cursor.fetchone() is not None
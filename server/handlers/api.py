@@ -4,23 +4,147 @@ API Handler - API处理器
 遵循单一职责原则：只负责API请求处理
 """
 
-import json
+import email.utils
+import hashlib
 import os
-import urllib.parse
+import shutil
+import socket
+import stat
+import time
+from functools import lru_cache
 from http.server import SimpleHTTPRequestHandler
-from typing import Dict, Any, Optional
-from urllib.parse import urlparse, parse_qs
+from typing import Callable, Dict, Any, Iterable, List, Optional, Tuple
+from urllib.parse import unquote
 
 from services.session_service import session_service
 from services.database_service import database_service
+from services.static_file_service import static_file_service, make_etag, etag_matches
 from config.settings import config
 from utils.helpers import (
-    parse_json_body, parse_query_string, extract_session_from_path,
+    read_json_request_body, extract_session_from_path,
+    get_query_param, split_request_path, parse_node_id,
+    parse_multipart_boundary, save_multipart_upload,
     build_json_response, build_error_response, build_success_response,
-    validate_node_data, normalize_path, get_content_type
+    validate_node_data, get_content_type, spool_request_body, iter_json_items, ijson,
+    quote_ident, MAX_BODY_BYTES, STREAMING_JSON_MIN_BYTES
 )
 
 
+# 无法使用 sendfile 时复制静态文件的缓冲区大小
+STATIC_COPY_BUFFER_SIZE = 256 * 1024
+
+
+@lru_cache(maxsize=64)
+def get_node_sql(table_name: str, id_field: str) -> str:
+    """获取按ID查询单个节点的语句，按 (表名, ID字段) 缓存，配置变更后自动使用新键"""
+    return f"SELECT * FROM {quote_ident(table_name)} WHERE {quote_ident(id_field)} = ?"
+
+
+# 热点处理器使用的配置值绑定为模块级变量，配置更新后由 refresh_config_bindings 重新绑定
+_STATIC_DIR = config.STATIC_DIR
+_GET_NODE_SQL = get_node_sql(config.table_name, config.id_field)
+
+
+def refresh_config_bindings() -> None:
+    """配置更新后重新绑定模块级配置值"""
+    global _GET_NODE_SQL
+    _GET_NODE_SQL = get_node_sql(config.table_name, config.id_field)
+
+
+# 固定错误消息的响应体，启动时序列化一次；错误响应体只包含消息，与状态码无关
+_ERROR_BODIES: Dict[str, bytes] = {
+    message: build_error_response(message)
+    for message in (
+        'Missing session identifier',
+        'Invalid or expired session',
+        'Invalid node ID',
+        'Node not found',
+        'File not found',
+        'Invalid data format',
+        'Session ID required',
+    )
+}
+
+# 元数据响应缓存：(表结构版本键, 已序列化的响应体, ETag)，表结构变化后重新序列化
+_meta_cache: Optional[Tuple[Any, bytes, str]] = None
+
+# 配置响应缓存：(配置快照对象, 已序列化的响应体)；配置写入时整体替换快照对象，按身份比较即可
+_config_cache: Optional[Tuple[Dict[str, Any], bytes]] = None
+
+# 数据库文件名缓存：(目录 st_mtime_ns, 排序后的文件名)，目录内容变化时目录 mtime 随之改变
+_db_files_cache: Optional[Tuple[int, Tuple[str, ...]]] = None
+
+DB_FILE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+
+def list_db_file_names(db_dir: str) -> Tuple[str, ...]:
+    """获取目录下的数据库文件名（按名称不区分大小写排序），目录未变化时复用上次结果"""
+    global _db_files_cache
+    dir_mtime = os.stat(db_dir).st_mtime_ns
+    cached = _db_files_cache
+    if cached is not None and cached[0] == dir_mtime:
+        return cached[1]
+
+    with os.scandir(db_dir) as entries:
+        names = tuple(sorted(
+            (entry.name for entry in entries
+             if entry.name.endswith(DB_FILE_SUFFIXES) and entry.is_file()),
+            key=str.lower
+        ))
+    _db_files_cache = (dir_mtime, names)
+    return names
+
+
+# Date 响应头缓存：(Unix秒, 已编码的 Date 行)，同一秒内的响应复用
+_date_cache: Tuple[int, bytes] = (0, b'')
+
+
+def http_date_header() -> bytes:
+    """获取当前秒的 Date 响应头行"""
+    global _date_cache
+    now = int(time.time())
+    cached_at, header = _date_cache
+    if cached_at != now:
+        header = b'Date: ' + email.utils.formatdate(now, usegmt=True).encode('latin-1') + b'\r\n'
+        _date_cache = (now, header)
+    return header
+
+
+@lru_cache(maxsize=64)
+def content_type_header(content_type: str) -> bytes:
+    """获取已编码的 Content-Type 响应头行"""
+    return b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n'
+
+
+class RequestBodyError(Exception):
+    """请求体无法读取（长度非法或超过上限）"""
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+
+def build_route_trie(routes: Dict[str, Dict[str, Callable]]) -> Dict[str, Any]:
+    """把路由表编译为按路径段索引的前缀树
+
+    以 '/' 结尾的路由（如 '/api/nodes/'）匹配其后的任意一个路径段。
+    """
+    def new_node() -> Dict[str, Any]:
+        return {'children': {}, 'wildcard': None, 'methods': None}
+
+    trie = new_node()
+    for route, methods in routes.items():
+        node = trie
+        for segment in route.strip('/').split('/'):
+            node = node['children'].setdefault(segment, new_node())
+        if route.endswith('/'):
+            if node['wildcard'] is None:
+                node['wildcard'] = new_node()
+            node = node['wildcard']
+        node['methods'] = methods
+    return trie
+
+
 class APIHandler(SimpleHTTPRequestHandler):
     """API处理器 - 单一职责：处理HTTP请求"""
 
@@ -73,6 +197,84 @@ class APIHandler(SimpleHTTPRequestHandler):
         }
     }
 
+    # 编译后的路由前缀树，匹配耗时只与路径深度有关；
+    # 叶子节点保存处理函数本身，在类定义之后构建
+    ROUTE_TRIE: Dict[str, Any] = {}
+
+    # 不含通配段的路由按完整路径直接索引，命中时无需拆分路径
+    EXACT_ROUTES: Dict[str, Dict[str, Callable]] = {}
+
+    # 无需会话验证的公开端点（/api/session 的所有操作、配置文件与数据表查询）
+    SESSION_EXEMPT_PATHS = frozenset({
+        '/api/session',
+        '/api/config/tables',
+        '/api/config/db-files'
+    })
+
+    # 所有响应共用的 CORS 响应头，预先编码为字节串
+    _CORS_HEADERS = (
+        b'Access-Control-Allow-Origin: *\r\n'
+        b'Access-Control-Allow-Methods: GET, POST, PUT, DELETE, OPTIONS\r\n'
+        b'Access-Control-Allow-Headers: Content-Type, Authorization\r\n'
+    )
+
+    # 响应头末尾的固定部分：CORS 响应头、Connection 响应头和空行（按是否关闭连接区分）
+    _HEAD_TAILS = {
+        False: _CORS_HEADERS + b'Connection: keep-alive\r\n\r\n',
+        True: _CORS_HEADERS + b'Connection: close\r\n\r\n'
+    }
+
+    # 分块传输的 JSON 响应在状态行之后、固定尾部之前的响应头
+    _CHUNKED_JSON_HEADERS = (
+        b'Content-Type: application/json; charset=utf-8\r\n'
+        b'Transfer-Encoding: chunked\r\n'
+    )
+
+    # CORS 预检响应的固定部分（按是否关闭连接区分），浏览器缓存预检结果一天
+    _OPTIONS_TAIL = _CORS_HEADERS + b'Access-Control-Max-Age: 86400\r\nContent-Length: 0\r\n'
+    _OPTIONS_TAILS = {
+        False: _OPTIONS_TAIL + b'Connection: keep-alive\r\n\r\n',
+        True: _OPTIONS_TAIL + b'Connection: close\r\n\r\n'
+    }
+
+    # 已编码的状态行及 Server 响应头，按 (协议版本, 状态码) 缓存
+    _STATUS_LINES: Dict[Tuple[str, int], bytes] = {}
+
+    # 请求体大小上限
+    MAX_BODY = MAX_BODY_BYTES
+
+    # 已验证会话的短期缓存：会话ID -> (缓存到期的 monotonic 时间, 会话)
+    SESSION_CACHE_TTL = 2.0
+    SESSION_CACHE_MAX = 1024
+    _session_cache: Dict[str, Tuple[float, Any]] = {}
+
+    # 流式 JSON 响应中每个分块的目标大小
+    STREAM_CHUNK_SIZE = 64 * 1024
+
+    # 使用 HTTP/1.1 持久连接；空闲超过 timeout 秒的连接由服务器关闭，释放处理线程
+    protocol_version = 'HTTP/1.1'
+    timeout = 30
+
+    # 响应头与 sendfile 发送的文件体分两次写出，关闭 Nagle 算法避免第二次写等待延迟确认
+    disable_nagle_algorithm = True
+
+    def __init_subclass__(cls, **kwargs):
+        """子类重新解析路由表，使子类覆盖的处理器方法生效"""
+        super().__init_subclass__(**kwargs)
+        cls.resolve_routes()
+
+    @classmethod
+    def resolve_routes(cls) -> None:
+        """把 API_ROUTES 中的处理器名称解析为本类的函数对象并编译路由表"""
+        resolved = {
+            route: {method: getattr(cls, name) for method, name in methods.items()}
+            for route, methods in cls.API_ROUTES.items()
+        }
+        cls.ROUTE_TRIE = build_route_trie(resolved)
+        cls.EXACT_ROUTES = {
+            route: methods for route, methods in resolved.items() if not route.endswith('/')
+        }
+
     def __init__(self, *args, directory=None, **kwargs):
         super().__init__(*args, directory=str(config.STATIC_DIR), **kwargs)
 
@@ -94,12 +296,16 @@ class APIHandler(SimpleHTTPRequestHandler):
 
     def _handle_request(self, method: str):
         """处理请求的通用逻辑"""
+        self._body_consumed = False
+
+        # 线程池已满、有连接在排队时，本次响应后关闭持久连接，把线程让给排队的连接
+        has_waiting = getattr(self.server, 'has_waiting_connections', None)
+        if has_waiting is not None and has_waiting():
+            self.close_connection = True
         try:
             # 解析路径
-            path = normalize_path(self.path)
-            parsed = urlparse(path)
+            parsed = split_request_path(self.path)
 
-            
             # 尝试匹配API路由
             handler = self._match_api_route(parsed.path, method)
 
@@ -107,84 +313,225 @@ class APIHandler(SimpleHTTPRequestHandler):
                 # 获取会话ID
                 session_id = self._extract_session_id(parsed)
 
-                # 验证会话（除了创建会话本身、获取会话列表、删除会话和获取配置信息）
-                # /api/session 的所有操作都是公开的（创建、获取列表、更新、删除）
-                # 其他需要会话验证的路径：
-                if parsed.path == '/api/session':
-                    # /api/session 的所有操作都是公开的
-                    pass
-                elif parsed.path in ['/api/config/tables', '/api/config/db-files']:
-                    # 这些端点也是公开的
-                    pass
-                elif not session_id:
-                    # 其他所有端点都需要会话ID
-                    self._send_error('Missing session identifier', 401)
-                    return
-                else:
-                    # 验证会话是否有效
-                    session = session_service.get_session(session_id)
-                    if not session:
+                # 验证会话（公开端点除外），验证通过的会话保存在 self._session 供处理器复用
+                self._session = None
+                if parsed.path not in self.SESSION_EXEMPT_PATHS:
+                    if not session_id:
+                        self._send_error('Missing session identifier', 401)
+                        return
+                    self._session = self._get_session(session_id)
+                    if not self._session:
                         self._send_error('Invalid or expired session', 401)
                         return
 
                 # 调用处理器
-                getattr(self, handler)(parsed, session_id)
+                handler(self, parsed, session_id)
             else:
                 # 尝试提供静态文件（不需要会话验证）
                 self.serve_static_file(parsed.path)
 
+        except RequestBodyError as e:
+            # 未读取的请求体留在连接中，响应后必须断开
+            self.close_connection = True
+            self._send_error(str(e), e.status)
         except Exception as e:
             self._send_error(f'Internal server error: {str(e)}', 500)
+        finally:
+            if not self._body_consumed:
+                self._discard_body()
+
+    def _get_session(self, session_id: str):
+        """获取并验证会话；短期缓存命中时只做无锁复核，不再进入会话服务的锁和过期扫描"""
+        now = time.monotonic()
+        cached = self._session_cache.get(session_id)
+        if cached is not None and now < cached[0] and session_service.is_live(session_id, cached[1]):
+            session = cached[1]
+            session.touch()
+            return session
 
-    def _match_api_route(self, path: str, method: str) -> Optional[str]:
-        """匹配API路由"""
-        # 特殊处理根路径
-        if path == '/':
-            return None
-
-        # 精确匹配
-        if path in self.API_ROUTES:
-            return self.API_ROUTES[path].get(method)
-
-        # 模糊匹配
-        for route, methods in self.API_ROUTES.items():
-            if route.endswith('/') and path.startswith(route):
-                return methods.get(method)
-            elif path != '/' and path.endswith('/') and route.startswith(path):
-                return methods.get(method)
-        return None
+        session = session_service.get_session(session_id)
+        if session:
+            if len(self._session_cache) >= self.SESSION_CACHE_MAX:
+                self._session_cache.clear()
+            self._session_cache[session_id] = (now + self.SESSION_CACHE_TTL, session)
+        else:
+            self._session_cache.pop(session_id, None)
+        return session
+
+    def _match_api_route(self, path: str, method: str) -> Optional[Callable]:
+        """匹配API路由，通配段的值保存在 self._route_param 供处理器使用"""
+        methods = self.EXACT_ROUTES.get(path)
+        if methods is not None:
+            self._route_param = None
+            return methods.get(method)
+
+        node = self.ROUTE_TRIE
+        param = None
+        for segment in path.strip('/').split('/'):
+            child = node['children'].get(segment)
+            if child is None:
+                child = node['wildcard']
+                if child is None:
+                    return None
+                # 路径已在 split_request_path 中去掉查询串；只有含转义时才解码
+                param = unquote(segment) if '%' in segment else segment
+            node = child
+
+        self._route_param = param
+
+        methods = node['methods']
+        return methods.get(method) if methods else None
+
+    def _body_length(self) -> int:
+        """获取并校验请求体长度，长度非法或超过上限时抛出 RequestBodyError"""
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            raise RequestBodyError('Invalid Content-Length', 400)
+        if content_length < 0:
+            raise RequestBodyError('Invalid Content-Length', 400)
+        if content_length > self.MAX_BODY:
+            raise RequestBodyError('Payload too large', 413)
+        return content_length
+
+    def _read_body(self) -> bytes:
+        """按 Content-Length 一次性读取请求体，长度非法或超过上限时抛出 RequestBodyError"""
+        content_length = self._body_length()
+        self._body_consumed = True
+        return self.rfile.read(content_length)
+
+    def _read_json_body(self) -> Any:
+        """读取并解析JSON请求体，空请求体直接返回空字典"""
+        content_length = self._body_length()
+        self._body_consumed = True
+        return read_json_request_body(self.rfile, content_length) if content_length else {}
+
+    def _discard_body(self):
+        """丢弃处理器未读取的请求体，避免其被当作持久连接上的下一个请求；无法丢弃时断开连接"""
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            content_length = -1
+        if content_length == 0:
+            return
+        if 0 < content_length <= self.MAX_BODY:
+            self.rfile.read(content_length)
+        else:
+            self.close_connection = True
 
     def _extract_session_id(self, parsed) -> Optional[str]:
         """提取会话ID"""
         # 从查询参数提取
-        query_params = parse_qs(parsed.query)
-        session_query = query_params.get('session')
+        session_query = get_query_param(parsed.query, 'session')
         if session_query:
-            return session_query[0]
+            return session_query
 
         # 从路径提取
         return extract_session_from_path(parsed.path)
 
+    def _status_head(self, status: int) -> bytes:
+        """构建状态行及 Server/Date 响应头，并记录访问日志"""
+        self.log_request(status)
+        key = (self.protocol_version, status)
+        status_line = self._STATUS_LINES.get(key)
+        if status_line is None:
+            reason = self.responses.get(status, ('',))[0]
+            status_line = ('%s %d %s\r\nServer: %s\r\n' % (
+                self.protocol_version, status, reason, self.version_string()
+            )).encode('latin-1')
+            self._STATUS_LINES[key] = status_line
+        return status_line + http_date_header()
+
+    def _build_head(self, status: int, content_type: str, content_length: int,
+                    etag: Optional[str] = None) -> bytes:
+        """构建完整的响应头字节串"""
+        head = (
+            self._status_head(status) + content_type_header(content_type)
+            + b'Content-Length: %d\r\n' % content_length
+        )
+        if etag:
+            head += b'ETag: ' + etag.encode('latin-1') + b'\r\n'
+        return head + self._HEAD_TAILS[bool(self.close_connection)]
+
+    def _send_headers(self, status: int, content_type: str, content_length: int,
+                      etag: Optional[str] = None):
+        """发送状态行和响应头"""
+        self.wfile.write(self._build_head(status, content_type, content_length, etag))
+
     def _send_response(self, data: bytes, status: int = 200,
-                      content_type: str = 'application/json; charset=utf-8'):
-        """发送响应"""
-        self.send_response(status)
-        self.send_header('Content-Type', content_type)
-        self.send_header('Content-Length', str(len(data)))
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        self.end_headers()
-        self.wfile.write(data)
+                      content_type: str = 'application/json; charset=utf-8',
+                      etag: Optional[str] = None):
+        """发送响应：响应头与响应体合并为一次写入"""
+        self.wfile.write(self._build_head(status, content_type, len(data), etag) + data)
+
+    def _send_not_modified(self, etag: str):
+        """发送 304 响应（无响应体）"""
+        self.wfile.write(
+            self._status_head(304) + b'ETag: ' + etag.encode('latin-1') + b'\r\n'
+            + self._HEAD_TAILS[bool(self.close_connection)]
+        )
 
     def _send_json(self, data: Any, status: int = 200):
         """发送JSON响应"""
         response = build_json_response(data, status)
         self._send_response(response, status)
 
+    def _send_json_stream(self, batches: Iterable[List[Any]]):
+        """以分块传输编码流式发送 JSON 数组，HTTP/1.0 连接回退为一次性发送
+
+        每批记录整体序列化一次，去掉外层方括号后拼接到数组中。
+        响应头随第一个分块写出，结束分块随最后一个分块写出：结果不足一个分块时整个响应只有一次写入。
+        """
+        batches = iter(batches)
+        if self.request_version != 'HTTP/1.1' or self.protocol_version != 'HTTP/1.1':
+            self._send_json([record for batch in batches for record in batch])
+            return
+
+        # 发送响应头之前先取第一批记录，查询出错时仍能返回错误响应
+        buf = bytearray(b'[')
+        first = next(batches, None)
+        has_records = bool(first)
+        if has_records:
+            buf += build_json_response(first)[1:-1]
+
+        # 尚未发出的响应头
+        head = (
+            self._status_head(200) + self._CHUNKED_JSON_HEADERS
+            + self._HEAD_TAILS[bool(self.close_connection)]
+        )
+        try:
+            for batch in batches:
+                if not batch:
+                    continue
+                if len(buf) >= self.STREAM_CHUNK_SIZE:
+                    self.wfile.write(head + self._frame_chunk(buf))
+                    head = b''
+                    buf = bytearray()
+                if has_records:
+                    buf += b','
+                buf += build_json_response(batch)[1:-1]
+                has_records = True
+            buf += b']'
+            self.wfile.write(head + self._frame_chunk(buf) + b'0\r\n\r\n')
+        except Exception as e:
+            if head and not isinstance(e, OSError):
+                # 响应头尚未发出（且不是连接本身出错），仍可返回错误响应
+                self._send_error(f'Internal server error: {str(e)}', 500)
+                return
+            # 响应头已经发出，只能断开连接，客户端会因缺少结束分块而感知响应不完整
+            self.close_connection = True
+            self._log_error(f"流式响应中断: {str(e)}")
+
+    @staticmethod
+    def _frame_chunk(data: bytes) -> bytes:
+        """按分块传输编码封装一个分块"""
+        return b'%x\r\n' % len(data) + data + b'\r\n'
+
     def _send_error(self, message: str, status: int = 400):
-        """发送错误响应"""
-        response = build_error_response(message, status)
+        """发送错误响应，固定消息直接使用预先序列化的响应体"""
+        response = _ERROR_BODIES.get(message)
+        if response is None:
+            response = build_error_response(message, status)
         self._send_response(response, status)
 
     def _send_success(self, data: Any = None, message: str = "Success", status: int = 200):
@@ -194,52 +541,80 @@ class APIHandler(SimpleHTTPRequestHandler):
 
     def serve_static_file(self, path: str):
         """提供静态文件"""
-        # 移除查询参数
-        if '?' in path:
-            path = path.split('?')[0]
-
         # 默认文件
         if path == '/':
             path = '/index.html'
 
+        # 拒绝跳出静态目录的路径
+        if '..' in path.replace('\\', '/').split('/'):
+            self._send_error('File not found', 404)
+            return
+
         # 构建文件路径
-        file_path = config.STATIC_DIR / path.lstrip('/')
+        file_path = _STATIC_DIR / path.lstrip('/')
 
         # 检查文件是否存在
-        if not file_path.exists() or not file_path.is_file():
+        try:
+            st = file_path.stat()
+        except OSError:
+            st = None
+        if st is None or not stat.S_ISREG(st.st_mode):
             self._send_error('File not found', 404)
             return
 
-        # 读取文件
+        # 客户端缓存仍然有效时只返回 304
+        etag = make_etag(st)
+        if etag_matches(self.headers.get('If-None-Match'), etag):
+            self._send_not_modified(etag)
+            return
+
+        content_type = get_content_type(path)
         try:
-            with open(file_path, 'rb') as f:
-                content = f.read()
+            # 小文件从内存缓存读取，修改时间变化后自动重新加载
+            content = static_file_service.get_content(file_path, st)
+            if content is not None:
+                head = self._build_head(200, content_type, len(content), etag)
+                if len(content) <= STATIC_COPY_BUFFER_SIZE:
+                    # 小文件与响应头合并为一次写入
+                    self.wfile.write(head + content)
+                else:
+                    self.wfile.write(head)
+                    self.wfile.write(content)
+                return
 
-            content_type = get_content_type(path)
-            self._send_response(content, 200, content_type)
+            # 打开文件后再发送响应头，发送阶段不再读入整个文件
+            f = open(file_path, 'rb')
         except IOError:
             self._send_error('Failed to read file', 500)
+            return
+
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            self._send_headers(200, content_type, size, etag)
+            self._send_file(f, size)
+
+    def _send_file(self, f, size: int):
+        """发送文件内容：套接字连接使用 sendfile 零拷贝，否则分块复制"""
+        connection = getattr(self, 'connection', None)
+        if isinstance(connection, socket.socket):
+            connection.sendfile(f, 0, size)
+        else:
+            shutil.copyfileobj(f, self.wfile, STATIC_COPY_BUFFER_SIZE)
 
     # ==================== Node Handlers ====================
 
     def handle_get_nodes(self, parsed, session_id: str):
         """获取所有节点"""
-        nodes = database_service.get_all_nodes()
-        self._send_json(nodes)
+        self._send_json_stream(database_service.iter_node_batches())
 
     def handle_get_node(self, parsed, session_id: str):
         """获取单个节点"""
-        node_id = parsed.path.split('/')[-1]
-        try:
-            node_id = int(node_id)
-        except ValueError:
+        node_id = parse_node_id(self._route_param or '')
+        if node_id is None:
             self._send_error('Invalid node ID', 400)
             return
 
-        nodes = database_service.execute_query(
-            f"SELECT * FROM {config.table_name} WHERE {config.id_field} = ?",
-            (node_id,)
-        )
+        nodes = database_service.execute_query(_GET_NODE_SQL, (node_id,))
 
         if nodes:
             self._send_json(nodes[0])
@@ -248,9 +623,7 @@ class APIHandler(SimpleHTTPRequestHandler):
 
     def handle_create_node(self, parsed, session_id: str):
         """创建节点"""
-        content_length = int(self.headers.get('Content-Length', 0))
-        body = self.rfile.read(content_length).decode('utf-8')
-        data = parse_json_body(body)
+        data = self._read_json_body()
 
         # 验证数据
         is_valid, error = validate_node_data(data)
@@ -259,21 +632,21 @@ class APIHandler(SimpleHTTPRequestHandler):
             return
 
         # 创建节点
-        node_id = database_service.create_node(data)
+        try:
+            node_id = database_service.create_node(data)
+        except ValueError as e:
+            self._send_error(str(e), 400)
+            return
         self._send_success({'id': node_id}, 'Node created successfully', 201)
 
     def handle_update_node(self, parsed, session_id: str):
         """更新节点"""
-        node_id = parsed.path.split('/')[-1]
-        try:
-            node_id = int(node_id)
-        except ValueError:
+        node_id = parse_node_id(self._route_param or '')
+        if node_id is None:
             self._send_error('Invalid node ID', 400)
             return
 
-        content_length = int(self.headers.get('Content-Length', 0))
-        body = self.rfile.read(content_length).decode('utf-8')
-        data = parse_json_body(body)
+        data = self._read_json_body()
 
         # 验证数据
         is_valid, error = validate_node_data(data)
@@ -282,7 +655,11 @@ class APIHandler(SimpleHTTPRequestHandler):
             return
 
         # 更新节点
-        rows_affected = database_service.update_node(node_id, data)
+        try:
+            rows_affected = database_service.update_node(node_id, data)
+        except ValueError as e:
+            self._send_error(str(e), 400)
+            return
         if rows_affected > 0:
             self._send_success(message='Node updated successfully')
         else:
@@ -290,10 +667,8 @@ class APIHandler(SimpleHTTPRequestHandler):
 
     def handle_delete_node(self, parsed, session_id: str):
         """删除节点"""
-        node_id = parsed.path.split('/')[-1]
-        try:
-            node_id = int(node_id)
-        except ValueError:
+        node_id = parse_node_id(self._route_param or '')
+        if node_id is None:
             self._send_error('Invalid node ID', 400)
             return
 
@@ -308,21 +683,35 @@ class APIHandler(SimpleHTTPRequestHandler):
 
     def handle_get_meta(self, parsed, session_id: str):
         """获取元数据"""
-        database_service.refresh_column_types()
-        database_service.refresh_foreign_keys()
-
-        meta = {
-            'columns': config.COLUMN_TYPES,
-            'foreignKeys': config.FOREIGN_KEYS,
-            'columnInfo': config.COLUMN_INFO
-        }
-        self._send_json(meta)
+        global _meta_cache
+        database_service.refresh_metadata()
+
+        # 先取版本键再读取配置：并发刷新时缓存内容只可能比版本键更新，不会更旧
+        version = database_service.meta_version()
+        cached = _meta_cache
+        if cached is None or cached[0] != version:
+            meta = {
+                'columns': config.COLUMN_TYPES,
+                'foreignKeys': config.FOREIGN_KEYS,
+                'columnInfo': config.COLUMN_INFO
+            }
+            response = build_json_response(meta)
+            # ETag 取自内容摘要：表结构版本变化但元数据内容不变时，客户端缓存仍然有效
+            etag = '"' + hashlib.blake2b(response, digest_size=8).hexdigest() + '"'
+            cached = (version, response, etag)
+            _meta_cache = cached
+
+        _, response, etag = cached
+        if etag_matches(self.headers.get('If-None-Match'), etag):
+            self._send_not_modified(etag)
+            return
+        self._send_response(response, etag=etag)
 
     # ==================== Foreign Handlers ====================
 
     def handle_get_foreign(self, parsed, session_id: str):
         """获取外键选项"""
-        column = parsed.path.split('/')[-1]
+        column = self._route_param
         options = database_service.fetch_foreign_options(column)
         self._send_json(options)
 
@@ -330,26 +719,30 @@ class APIHandler(SimpleHTTPRequestHandler):
 
     def handle_get_config(self, parsed, session_id: str):
         """获取配置"""
+        global _config_cache
         config_snapshot = config.get_config_snapshot()
-        self._send_json(config_snapshot)
+        cached = _config_cache
+        if cached is None or cached[0] is not config_snapshot:
+            cached = (config_snapshot, build_json_response(config_snapshot))
+            _config_cache = cached
+        self._send_response(cached[1])
 
     def handle_update_config(self, parsed, session_id: str):
         """更新配置"""
-        content_length = int(self.headers.get('Content-Length', 0))
-        body = self.rfile.read(content_length).decode('utf-8')
-        new_config = parse_json_body(body)
+        new_config = self._read_json_body()
 
-        # 更新会话配置
-        session = session_service.get_session(session_id)
-        if session:
+        # 更新会话配置（会话已在 _handle_request 中验证）
+        if self._session:
             session_service.update_session(session_id, new_config)
 
-        # 更新服务器配置
+        # 更新服务器配置；配置未变化时快照仍是同一对象，跳过重新绑定和表结构检查
         old_config = config.update_server_config(new_config)
+        if config.get_config_snapshot() is not old_config:
+            refresh_config_bindings()
 
-        # 重新初始化数据库
-        database_service._db_path = config.db_path
-        database_service.ensure_schema()
+            # 重新初始化数据库
+            database_service.bind_db_path()
+            database_service.ensure_schema()
 
         self._send_success(message='Configuration updated successfully')
 
@@ -362,9 +755,7 @@ class APIHandler(SimpleHTTPRequestHandler):
 
     def handle_create_session(self, parsed, session_id: str):
         """创建会话"""
-        content_length = int(self.headers.get('Content-Length', 0))
-        body = self.rfile.read(content_length).decode('utf-8')
-        config_payload = parse_json_body(body)
+        config_payload = self._read_json_body()
 
         try:
             session = session_service.create_session(config_payload)
@@ -377,21 +768,11 @@ class APIHandler(SimpleHTTPRequestHandler):
             self._send_error(str(e), 409)
 
     def handle_update_session(self, parsed, session_id: str):
-        """更新会话"""
-        # 如果没有从查询参数获取到session_id，尝试从路径获取
-        if not session_id and parsed.path.startswith('/api/session/'):
-            # 从路径中提取会话ID：/api/session/{sessionId}
-            path_parts = parsed.path.strip('/').split('/')
-            if len(path_parts) >= 3:
-                session_id = path_parts[2]
-
-        content_length = int(self.headers.get('Content-Length', 0))
-        body = self.rfile.read(content_length).decode('utf-8')
-        config_payload = parse_json_body(body)
+        """更新会话（session_id 已由 _extract_session_id 从查询参数或路径解析）"""
+        config_payload = self._read_json_body()
 
         # 检查是否强制更新
-        query_params = parse_qs(parsed.query)
-        force = query_params.get('force', ['false'])[0].lower() == 'true'
+        force = (get_query_param(parsed.query, 'force') or 'false').lower() == 'true'
 
         try:
             session = session_service.update_session(session_id, config_payload, force)
@@ -403,16 +784,10 @@ class APIHandler(SimpleHTTPRequestHandler):
             self._send_error(str(e), 409)
 
     def handle_delete_session(self, parsed, session_id: str):
-        """删除会话"""
-        # 如果没有从查询参数获取到session_id，尝试从路径获取
-        if not session_id and parsed.path.startswith('/api/session/'):
-            # 从路径中提取会话ID：/api/session/{sessionId}
-            path_parts = parsed.path.strip('/').split('/')
-            if len(path_parts) >= 3:
-                session_id = path_parts[2]
-
+        """删除会话（session_id 已由 _extract_session_id 从查询参数或路径解析）"""
         if session_id:
             # 删除指定的会话
+            self._session_cache.pop(session_id, None)
             session_service.destroy_session(session_id)
             self._send_success(message='Session deleted successfully')
         else:
@@ -423,23 +798,47 @@ class APIHandler(SimpleHTTPRequestHandler):
 
     def handle_restore_nodes(self, parsed, session_id: str):
         """恢复节点"""
-        content_length = int(self.headers.get('Content-Length', 0))
-        body = self.rfile.read(content_length).decode('utf-8')
-        data = parse_json_body(body)
-
-        nodes = data.get('nodes', [])
-        restored_count = 0
-
-        for node in nodes:
-            if isinstance(node, dict) and 'id' in node:
-                node_id = node['id']
-                del node['id']
-                if database_service.update_node(node_id, node) > 0:
-                    restored_count += 1
-                else:
-                    # 尝试创建
-                    database_service.create_node(node)
-                    restored_count += 1
+        content_length = self._body_length()
+        if ijson is not None and content_length >= STREAMING_JSON_MIN_BYTES:
+            self._restore_nodes_streaming(content_length)
+            return
+
+        data = self._read_json_body()
+
+        nodes = data.get('nodes', []) if isinstance(data, dict) else None
+        if not isinstance(nodes, list):
+            self._send_error('Invalid data format', 400)
+            return
+        rows = [node for node in nodes if isinstance(node, dict) and 'id' in node]
+
+        # 单个事务内批量写入，已删除的节点按原ID恢复
+        try:
+            restored_count = database_service.bulk_upsert(rows)
+        except ValueError as e:
+            self._send_error(str(e), 400)
+            return
+
+        self._send_success(
+            {'restored': restored_count},
+            f'Restored {restored_count} nodes'
+        )
+
+    def _restore_nodes_streaming(self, content_length: int):
+        """恢复较大的请求体：先完整落到临时文件，再逐个解析节点并分批写入，内存占用与节点数量无关
+
+        写事务内只做本地解析和 SQLite 操作，不会在持有写锁时等待客户端网络。
+        """
+        self._body_consumed = True
+        with spool_request_body(self.rfile, content_length) as spool:
+            rows = (
+                node for node in iter_json_items(spool, 'nodes.item')
+                if isinstance(node, dict) and 'id' in node
+            )
+            try:
+                restored_count = database_service.bulk_upsert(rows)
+            except ValueError as e:
+                self._send_error(str(e), 400)
+                return
 
         self._send_success(
             {'restored': restored_count},
@@ -458,22 +857,24 @@ class APIHandler(SimpleHTTPRequestHandler):
             if not os.path.exists(db_path):
                 os.makedirs(db_path, exist_ok=True)
 
-            # 获取所有数据库文件
+            # 获取所有数据库文件；文件名列表按目录 mtime 缓存，
+            # 文件写入不会改变目录 mtime，所以大小和修改时间每次重新读取
             files = []
-            for file in os.listdir(db_path):
-                if file.endswith(('.db', '.sqlite', '.sqlite3')):
-                    file_path = os.path.join(db_path, file)
-                    stat = os.stat(file_path)
-                    files.append({
-                        'name': file,
-                        'path': os.path.join('data', 'databases', file),
-                        'size': stat.st_size,
-                        'modified': stat.st_mtime
-                    })
+            for file in list_db_file_names(db_path):
+                try:
+                    stat = os.stat(os.path.join(db_path, file))
+                except FileNotFoundError:
+                    continue
+                files.append({
+                    'name': file,
+                    'path': os.path.join('data', 'databases', file),
+                    'size': stat.st_size,
+                    'modified': stat.st_mtime
+                })
 
             self._send_json({
                 'success': True,
-                'files': sorted(files, key=lambda x: x['name'].lower())
+                'files': files
             })
 
         except Exception as e:
@@ -489,41 +890,30 @@ class APIHandler(SimpleHTTPRequestHandler):
                 self._send_error('没有上传文件', 400)
                 return
 
-            # 解析multipart数据
-            boundary = self.headers.get('Content-Type').split('boundary=')[1]
-            data = self.rfile.read(content_length).decode('utf-8')
-
-            # 提取文件名和内容
-            parts = data.split(boundary)
-            for part in parts:
-                if 'filename=' in part:
-                    lines = part.split('\n')
-                    filename_line = [line for line in lines if 'filename=' in line][0]
-                    filename = filename_line.split('filename="')[1].split('"')[0]
-
-                    # 获取文件内容（去除headers）
-                    content_start = part.find('\n\n') + 2
-                    content_end = part.rfind('\n--')
-                    file_content = part[content_start:content_end].encode('utf-8')
-
-                    # 保存文件
-                    upload_dir = os.path.join(os.getcwd(), 'data', 'databases', 'uploads')
-                    os.makedirs(upload_dir, exist_ok=True)
-
-                    file_path = os.path.join(upload_dir, filename)
-                    with open(file_path, 'wb') as f:
-                        f.write(file_content)
+            # 解析multipart边界
+            boundary = parse_multipart_boundary(self.headers.get('Content-Type'))
+            if not boundary:
+                self._send_error('无法解析上传的文件', 400)
+                return
 
-                    self._send_json({
-                        'success': True,
-                        'message': f'文件 {filename} 上传成功',
-                        'path': os.path.join('data', 'databases', 'uploads', filename)
-                    })
-                    return
+            # 流式解析并保存文件，请求体不会整体读入内存
+            self._body_consumed = True
+            upload_dir = os.path.join(os.getcwd(), 'data', 'databases', 'uploads')
+            filename = save_multipart_upload(self.rfile, content_length, boundary, upload_dir)
+            if filename is None:
+                # 请求体可能没有读完，不能复用连接
+                self.close_connection = True
+                self._send_error('无法解析上传的文件', 400)
+                return
 
-            self._send_error('无法解析上传的文件', 400)
+            self._send_json({
+                'success': True,
+                'message': f'文件 {filename} 上传成功',
+                'path': os.path.join('data', 'databases', 'uploads', filename)
+            })
 
         except Exception as e:
+            self.close_connection = True
             self._log_error(f"上传数据库文件失败: {str(e)}")
             self._send_error('上传失败', 500)
 
@@ -531,8 +921,7 @@ class APIHandler(SimpleHTTPRequestHandler):
         """获取表列表"""
         try:
             # 获取查询参数中的数据库路径
-            query_params = urllib.parse.parse_qs(parsed.query)
-            db_path = query_params.get('db_path', [None])[0]
+            db_path = get_query_param(parsed.query, 'db_path')
 
             if not db_path:
                 self._send_error('缺少数据库路径参数', 400)
@@ -578,8 +967,8 @@ class APIHandler(SimpleHTTPRequestHandler):
     
     def do_OPTIONS(self):
         """处理OPTIONS请求（CORS预检）"""
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        self.end_headers()
\ No newline at end of file
+        self.wfile.write(self._status_head(200) + self._OPTIONS_TAILS[bool(self.close_connection)])
+
+
+# 导入时把处理器名称解析为函数对象，分派时直接调用而不再按名称查找属性
+APIHandler.resolve_routes()
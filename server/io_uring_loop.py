@@ -0,0 +1,316 @@
+"""
+io_uring Server Loop - io_uring 服务器循环
+设置 TREEDB_USE_IO_URING=1 且 Linux >= 5.11、安装了 liburing 绑定时，使用 io_uring 完成 accept/recv/send
+该后端需显式启用，其余情况使用 asyncio 服务器
+"""
+
+import os
+import platform
+import queue
+import socket
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Callable, Dict, Tuple
+
+try:
+    import liburing
+except ImportError:
+    liburing = None
+
+from utils.helpers import (
+    parse_content_length, request_body_limit,
+    build_payload_too_large_response, build_raw_error_response
+)
+
+
+# io_uring 要求的最低内核版本（多次触发的 accept）
+MIN_KERNEL_VERSION = (5, 11)
+
+# 队列深度与单次接收缓冲区大小；SQ 满时 _get_sqe 会先提交，
+# 小环（每条 I/O 路径约128个槽位）比一个巨大的环缓存更友好
+QUEUE_DEPTH = 128
+RECV_SIZE = 4096
+
+# NAPI 忙轮询时长（微秒）
+NAPI_BUSY_POLL_USEC = 50
+
+# user_data 低两位编码操作类型，其余位为文件描述符
+OP_ACCEPT, OP_RECV, OP_SEND, OP_WAKE = range(4)
+
+# 请求头（请求行及各头部）的大小上限，与 asyncio StreamReader 的默认上限一致
+MAX_REQUEST_HEAD_BYTES = 64 * 1024
+
+# 请求体超过上限时直接返回的完整 413 响应；请求头过大时返回 431
+PAYLOAD_TOO_LARGE_RESPONSE = build_payload_too_large_response()
+HEADERS_TOO_LARGE_RESPONSE = build_raw_error_response(
+    HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, 'Request header fields too large'
+)
+
+
+def kernel_version() -> Tuple[int, ...]:
+    """解析当前内核的主次版本号"""
+    parts = platform.release().split('-')[0].split('.')
+    try:
+        return tuple(int(part) for part in parts[:2])
+    except ValueError:
+        return (0, 0)
+
+
+def is_available() -> bool:
+    """检查 io_uring 后端是否已启用且可用（需设置 TREEDB_USE_IO_URING=1）"""
+    if os.environ.get('TREEDB_USE_IO_URING') != '1':
+        return False
+    if liburing is None or sys.platform != 'linux':
+        return False
+    return kernel_version() >= MIN_KERNEL_VERSION
+
+
+class IoUringServer:
+    """io_uring HTTP服务器 - 单一职责：在环上完成连接的收发
+
+    请求处理（数据库等阻塞操作）交给线程池执行，完成后通过 eventfd 唤醒环，
+    所有 SQE 都只在创建并运行 serve_forever 的线程上提交（SINGLE_ISSUER 的要求）。
+    """
+
+    def __init__(self, host: str, port: int,
+                 process: Callable[[bytes, tuple], bytes], max_workers: int):
+        self._process = process
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._completed: queue.Queue = queue.Queue()
+        self._wake_fd = os.eventfd(0)
+        # 保护 _wake_fd 的关闭与写入：关闭后置为 -1，之后的唤醒都是空操作，
+        # 不会写入已关闭（或编号已被复用）的描述符
+        self._wake_lock = threading.Lock()
+        self._wake_buf = bytearray(8)
+        self._recv_bufs: Dict[int, bytearray] = {}
+        self._requests: Dict[int, bytearray] = {}
+        # 尚未找到请求头结尾的连接下次查找的起始位置；已解析请求头的连接的完整请求长度
+        self._scan_offsets: Dict[int, int] = {}
+        self._request_totals: Dict[int, int] = {}
+        self._responses: Dict[int, memoryview] = {}
+        self.running = False
+
+        # 监听套接字及 accept 得到的连接保持阻塞模式：
+        # 交给 io_uring 的阻塞套接字不会产生 EAGAIN 重新排队
+        self._listener = socket.create_server((host, port), reuse_port=False)
+        self._ring = liburing.io_uring()
+        self._cqe = liburing.io_uring_cqe()
+        self._init_ring()
+
+    def _init_ring(self) -> None:
+        """初始化环：优先使用 SINGLE_ISSUER + DEFER_TASKRUN，并尝试启用 NAPI"""
+        params = liburing.io_uring_params()
+        params.flags = liburing.IORING_SETUP_SINGLE_ISSUER | liburing.IORING_SETUP_DEFER_TASKRUN
+        try:
+            liburing.io_uring_queue_init_params(QUEUE_DEPTH, self._ring, params)
+        except OSError:
+            # 内核 < 6.1 不支持 DEFER_TASKRUN
+            liburing.io_uring_queue_init(QUEUE_DEPTH, self._ring, 0)
+
+        register_napi = getattr(liburing, 'io_uring_register_napi', None)
+        if register_napi is None:
+            return
+        napi = liburing.io_uring_napi()
+        napi.prefer_busy_poll = 1
+        napi.busy_poll_to = NAPI_BUSY_POLL_USEC
+        try:
+            register_napi(self._ring, napi)
+        except OSError:
+            # 内核 < 6.9 不支持 NAPI 注册
+            pass
+
+    def _get_sqe(self, user_data: int):
+        """获取一个 SQE 并设置 user_data"""
+        sqe = liburing.io_uring_get_sqe(self._ring)
+        if sqe is None:
+            liburing.io_uring_submit(self._ring)
+            sqe = liburing.io_uring_get_sqe(self._ring)
+        liburing.io_uring_sqe_set_data64(sqe, user_data)
+        return sqe
+
+    def _arm_accept(self) -> None:
+        """提交多次触发的 accept"""
+        fd = self._listener.fileno()
+        sqe = self._get_sqe((fd << 2) | OP_ACCEPT)
+        liburing.io_uring_prep_multishot_accept(sqe, fd, None, 0)
+
+    def _arm_recv(self, fd: int) -> None:
+        """提交连接上的一次 recv"""
+        buf = self._recv_bufs.setdefault(fd, bytearray(RECV_SIZE))
+        sqe = self._get_sqe((fd << 2) | OP_RECV)
+        liburing.io_uring_prep_recv(sqe, fd, buf, RECV_SIZE, 0)
+
+    def _arm_send(self, fd: int) -> None:
+        """提交连接上剩余响应数据的 send"""
+        data = self._responses[fd]
+        sqe = self._get_sqe((fd << 2) | OP_SEND)
+        liburing.io_uring_prep_send(sqe, fd, data, len(data), 0)
+
+    def _arm_wake(self) -> None:
+        """提交 eventfd 读取，用于接收线程池的完成通知"""
+        sqe = self._get_sqe((self._wake_fd << 2) | OP_WAKE)
+        liburing.io_uring_prep_read(sqe, self._wake_fd, self._wake_buf, 8, 0)
+
+    def _close(self, fd: int) -> None:
+        """关闭连接并释放其缓冲区"""
+        self._recv_bufs.pop(fd, None)
+        self._requests.pop(fd, None)
+        self._scan_offsets.pop(fd, None)
+        self._request_totals.pop(fd, None)
+        self._responses.pop(fd, None)
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+    def _dispatch(self, fd: int, request: bytes) -> None:
+        """把完整请求交给线程池处理"""
+        try:
+            with socket.socket(fileno=os.dup(fd)) as sock:
+                peer = sock.getpeername()
+        except OSError:
+            peer = ('', 0)
+
+        def done(future, fd=fd):
+            try:
+                response = future.result()
+            except Exception:
+                response = b'HTTP/1.0 500 Internal Server Error\r\nContent-Length: 0\r\n\r\n'
+            self._completed.put((fd, response))
+            self._wake()
+
+        self._executor.submit(self._process, request, peer).add_done_callback(done)
+
+    def _on_recv(self, fd: int, res: int) -> None:
+        """处理 recv 完成事件，请求完整时分派处理"""
+        if res <= 0:
+            self._close(fd)
+            return
+
+        request = self._requests.setdefault(fd, bytearray())
+        request += self._recv_bufs[fd][:res]
+
+        total = self._request_totals.get(fd)
+        if total is None:
+            # 只从上次查找结束处（回退3字节以覆盖跨越两次接收的分隔符）继续查找请求头结尾
+            head_end = request.find(b'\r\n\r\n', self._scan_offsets.get(fd, 0))
+            if head_end < 0 or head_end > MAX_REQUEST_HEAD_BYTES:
+                if len(request) > MAX_REQUEST_HEAD_BYTES:
+                    self._reject(fd, HEADERS_TOO_LARGE_RESPONSE)
+                    return
+                self._scan_offsets[fd] = max(0, len(request) - 3)
+                self._arm_recv(fd)
+                return
+
+            head = bytes(request[:head_end])
+            try:
+                length = parse_content_length(head)
+            except ValueError:
+                length = -1
+            if length < 0:
+                self._close(fd)
+                return
+            # 超过该路由上限的请求体不再接收，直接返回 413，不把截断的请求交给处理器
+            if length > request_body_limit(head):
+                self._reject(fd, PAYLOAD_TOO_LARGE_RESPONSE)
+                return
+            total = head_end + 4 + length
+            self._scan_offsets.pop(fd, None)
+            self._request_totals[fd] = total
+
+        if len(request) >= total:
+            self._request_totals.pop(fd, None)
+            self._dispatch(fd, bytes(request[:total]))
+            return
+
+        self._arm_recv(fd)
+
+    def _reject(self, fd: int, response: bytes) -> None:
+        """不再接收请求，直接发送错误响应，发送完毕后关闭连接"""
+        self._requests.pop(fd, None)
+        self._scan_offsets.pop(fd, None)
+        self._request_totals.pop(fd, None)
+        self._responses[fd] = memoryview(response)
+        self._arm_send(fd)
+
+    def _on_send(self, fd: int, res: int) -> None:
+        """处理 send 完成事件，发送完毕后关闭连接"""
+        if res < 0:
+            self._close(fd)
+            return
+        remaining = self._responses[fd][res:]
+        if remaining:
+            self._responses[fd] = remaining
+            self._arm_send(fd)
+        else:
+            self._close(fd)
+
+    def _on_wake(self) -> None:
+        """处理线程池完成通知，提交响应的 send"""
+        while True:
+            try:
+                fd, response = self._completed.get_nowait()
+            except queue.Empty:
+                break
+            self._responses[fd] = memoryview(response)
+            self._arm_send(fd)
+        if self.running:
+            self._arm_wake()
+
+    def serve_forever(self) -> None:
+        """运行事件循环直到 shutdown"""
+        self.running = True
+        self._arm_accept()
+        self._arm_wake()
+        liburing.io_uring_submit(self._ring)
+
+        try:
+            while self.running:
+                liburing.io_uring_wait_cqe(self._ring, self._cqe)
+                cqe = self._cqe[0]
+                res, user_data, flags = cqe.res, cqe.user_data, cqe.flags
+                liburing.io_uring_cqe_seen(self._ring, cqe)
+
+                op, fd = user_data & 3, user_data >> 2
+                if op == OP_ACCEPT:
+                    if res >= 0:
+                        self._arm_recv(res)
+                    # 内核终止了多次触发的 accept 时重新提交
+                    if not flags & liburing.IORING_CQE_F_MORE:
+                        self._arm_accept()
+                elif op == OP_RECV:
+                    self._on_recv(fd, res)
+                elif op == OP_SEND:
+                    self._on_send(fd, res)
+                elif op == OP_WAKE:
+                    self._on_wake()
+
+                liburing.io_uring_submit(self._ring)
+        finally:
+            self.server_close()
+
+    def _wake(self) -> None:
+        """通过 eventfd 唤醒环；服务器已关闭时什么也不做"""
+        with self._wake_lock:
+            if self._wake_fd >= 0:
+                os.eventfd_write(self._wake_fd, 1)
+
+    def shutdown(self) -> None:
+        """请求停止事件循环（可从其他线程调用，serve_forever 返回后调用是空操作）"""
+        self.running = False
+        self._wake()
+
+    def server_close(self) -> None:
+        """释放环、监听套接字和线程池（重复调用是空操作）"""
+        with self._wake_lock:
+            if self._wake_fd < 0:
+                return
+            os.close(self._wake_fd)
+            self._wake_fd = -1
+        for fd in list(self._recv_bufs):
+            self._close(fd)
+        liburing.io_uring_queue_exit(self._ring)
+        self._listener.close()
+        self._executor.shutdown(wait=False)
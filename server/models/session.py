@@ -4,36 +4,57 @@ Session Model - 会话模型
 遵循单一职责原则：只负责会话数据结构
 """
 
+import os
+import time
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Dict, Any, Optional
-from uuid import UUID, uuid4
 
 
-@dataclass
+def new_session_id() -> str:
+    """生成随机 UUID4 格式的会话ID，直接格式化 os.urandom 字节，不构造 UUID 对象"""
+    raw = bytearray(os.urandom(16))
+    raw[6] = (raw[6] & 0x0F) | 0x40  # 版本 4
+    raw[8] = (raw[8] & 0x3F) | 0x80  # RFC 4122 变体
+    h = raw.hex()
+    return f'{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}'
+
+
+def _utc_isoformat(timestamp: float) -> str:
+    """把 Unix 时间戳格式化为不带时区后缀的 UTC ISO 字符串（与 datetime.utcnow().isoformat() 一致）"""
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).replace(tzinfo=None).isoformat()
+
+
+@dataclass(slots=True)
 class SessionRecord:
-    """会话记录数据类"""
-    id: str = field(default_factory=lambda: str(uuid4()))
-    created_at: datetime = field(default_factory=datetime.utcnow)
-    last_seen: datetime = field(default_factory=datetime.utcnow)
+    """会话记录数据类（使用 __slots__，实例不带 __dict__）"""
+    id: str = field(default_factory=new_session_id)
+    # 创建时间为 Unix 时间戳；最后活跃时间为 monotonic 时钟读数，不受系统时间调整影响
+    created_at_ts: float = field(default_factory=time.time)
+    last_seen_ts: float = field(default_factory=time.monotonic)
     config: Dict[str, Any] = field(default_factory=dict)
     meta: Optional[Dict[str, Any]] = field(default=None)
     refreshed_at: Optional[datetime] = field(default=None)
 
     def touch(self) -> None:
         """更新最后活跃时间"""
-        self.last_seen = datetime.utcnow()
+        self.last_seen_ts = time.monotonic()
+
+    def expires_in(self, timeout_seconds: int) -> float:
+        """距离过期的剩余秒数"""
+        return timeout_seconds - (time.monotonic() - self.last_seen_ts)
 
     def is_expired(self, timeout_seconds: int) -> bool:
         """检查会话是否过期"""
-        return (datetime.utcnow() - self.last_seen).total_seconds() > timeout_seconds
+        return self.expires_in(timeout_seconds) < 0
 
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典"""
+        last_seen_wall = time.time() - (time.monotonic() - self.last_seen_ts)
         return {
             'id': self.id,
-            'created_at': self.created_at.isoformat(),
-            'last_seen': self.last_seen.isoformat(),
+            'created_at': _utc_isoformat(self.created_at_ts),
+            'last_seen': _utc_isoformat(last_seen_wall),
             'config': self.config,
             'meta': self.meta,
             'refreshed_at': self.refreshed_at.isoformat() if self.refreshed_at else None
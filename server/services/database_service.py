@@ -6,12 +6,222 @@ Database Service - 数据库服务
 
 import sqlite3
 import os
+import re
 from contextlib import contextmanager
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Tuple, Union
-from threading import RLock
+from threading import Lock
+from typing import Dict, Iterable, Iterator, List, Any, Optional, Tuple
 
 from config.settings import config
+from utils.helpers import quote_ident
+
+
+# 流式读取节点时每批从游标取出的行数
+NODE_BATCH_SIZE = 500
+
+# 批量恢复时每次 executemany 前累积的行数
+UPSERT_BATCH_SIZE = 1000
+
+@lru_cache(maxsize=64)
+def upsert_sql(table_name: str, id_field: str, columns: Tuple[str, ...], has_updated_at: bool) -> str:
+    """构建按ID插入或更新的语句，按 (表名, ID字段, 列, 是否有 updated_at) 缓存"""
+    table = quote_ident(table_name)
+    id_column = quote_ident(id_field)
+    quoted = [quote_ident(column) for column in columns]
+    assignments = [f"{column} = excluded.{column}" for column in quoted]
+    if has_updated_at:
+        assignments.append("updated_at = CURRENT_TIMESTAMP")
+    conflict_action = f"DO UPDATE SET {', '.join(assignments)}" if assignments else "DO NOTHING"
+    return (
+        f"INSERT INTO {table} ({', '.join([id_column, *quoted])}) "
+        f"VALUES ({', '.join(['?'] * (len(quoted) + 1))}) "
+        f"ON CONFLICT({id_column}) {conflict_action}"
+    )
+
+
+@lru_cache(maxsize=64)
+def upsert_fallback_sql(table_name: str, id_field: str, columns: Tuple[str, ...],
+                        has_updated_at: bool) -> Tuple[Optional[str], str]:
+    """构建 ID 列没有唯一约束、不能使用 ON CONFLICT 时的 (按ID更新, 不存在时插入) 语句对
+
+    更新语句的参数为 (列值..., ID)，没有可更新的列时为 None；插入语句的参数为 (ID, 列值..., ID)。
+    """
+    table = quote_ident(table_name)
+    id_column = quote_ident(id_field)
+    quoted = [quote_ident(column) for column in columns]
+    assignments = [f"{column} = ?" for column in quoted]
+    if has_updated_at:
+        assignments.append("updated_at = CURRENT_TIMESTAMP")
+    update = (
+        f"UPDATE {table} SET {', '.join(assignments)} WHERE {id_column} = ?"
+        if assignments else None
+    )
+    insert = (
+        f"INSERT INTO {table} ({', '.join([id_column, *quoted])}) "
+        f"SELECT {', '.join(['?'] * (len(quoted) + 1))} "
+        f"WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {id_column} = ?)"
+    )
+    return update, insert
+
+
+@lru_cache(maxsize=64)
+def insert_sql(table_name: str, columns: Tuple[str, ...]) -> str:
+    """构建插入节点的语句，按 (表名, 列) 缓存"""
+    quoted = [quote_ident(column) for column in columns]
+    return (
+        f"INSERT INTO {quote_ident(table_name)} ({', '.join(quoted)}) "
+        f"VALUES ({', '.join(['?'] * len(quoted))})"
+    )
+
+
+@lru_cache(maxsize=64)
+def update_sql(table_name: str, id_field: str, columns: Tuple[str, ...]) -> str:
+    """构建按ID更新节点的语句，按 (表名, ID字段, 列) 缓存"""
+    assignments = [f"{quote_ident(column)} = ?" for column in columns]
+    return (
+        f"UPDATE {quote_ident(table_name)} SET {', '.join(assignments)}, updated_at = CURRENT_TIMESTAMP "
+        f"WHERE {quote_ident(id_field)} = ?"
+    )
+
+
+def _type_hint_pattern(hints) -> 're.Pattern[str]':
+    """把类型提示集合编译为一个子串匹配正则，一次扫描代替逐个提示的 in 判断"""
+    return re.compile('|'.join(re.escape(hint) for hint in sorted(hints, key=len, reverse=True)))
+
+
+_INTEGER_TYPE_RE = _type_hint_pattern(config.INTEGER_TYPE_HINTS)
+_FLOAT_TYPE_RE = _type_hint_pattern(config.FLOAT_TYPE_HINTS)
+_BOOLEAN_TYPE_RE = _type_hint_pattern(config.BOOLEAN_TYPE_HINTS)
+
+
+@lru_cache(maxsize=256)
+def column_type_category(col_type: str) -> str:
+    """把声明的列类型归类为 integer / float / boolean / text，按类型字符串缓存"""
+    col_type_upper = col_type.upper()
+    if _INTEGER_TYPE_RE.search(col_type_upper):
+        return 'integer'
+    if _FLOAT_TYPE_RE.search(col_type_upper):
+        return 'float'
+    if _BOOLEAN_TYPE_RE.search(col_type_upper):
+        return 'boolean'
+    return 'text'
+
+
+# UPDATE ... FROM 需要 SQLite 3.33+，更早的版本逐行更新排序值
+SUPPORTS_UPDATE_FROM = sqlite3.sqlite_version_info >= (3, 33, 0)
+
+
+@lru_cache(maxsize=16)
+def sort_rebuild_sql(table_name: str, id_field: str, parent_field: str, sort_column: str) -> str:
+    """构建按层级重建排序值的 UPDATE ... FROM 语句：从根节点起按 (深度, 父节点, ID) 依次编号为 10, 20, ...
+
+    排序值已经正确的行不在更新范围内，重复重建时不会改写这些行所在的页。
+    """
+    table = quote_ident(table_name)
+    id_column = quote_ident(id_field)
+    parent_column = quote_ident(parent_field)
+    sort_ident = quote_ident(sort_column)
+    return f'''
+        WITH RECURSIVE tree_path(node_id, parent_id, depth) AS (
+            SELECT {id_column}, {parent_column}, 0
+            FROM {table}
+            WHERE {parent_column} IS NULL
+            UNION ALL
+            SELECT t.{id_column}, t.{parent_column}, tp.depth + 1
+            FROM {table} t
+            JOIN tree_path tp ON t.{parent_column} = tp.node_id
+        )
+        UPDATE {table}
+        SET {sort_ident} = ranked.new_order
+        FROM (
+            SELECT node_id, ROW_NUMBER() OVER (ORDER BY depth, parent_id, node_id) * 10 AS new_order
+            FROM tree_path
+        ) AS ranked
+        WHERE {table}.{id_column} = ranked.node_id
+          AND {table}.{sort_ident} IS NOT ranked.new_order
+    '''
+
+
+# 检查表是否存在的语句
+TABLE_EXISTS_SQL = "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?"
+
+# 表结构查询使用表值 PRAGMA 函数并绑定表名：语句文本固定，可复用预编译语句，表名也不再拼接进 SQL
+TABLE_COLUMNS_SQL = "SELECT name, type FROM pragma_table_info(?)"
+FOREIGN_KEY_LIST_SQL = 'SELECT "table", "from", "to" FROM pragma_foreign_key_list(?)'
+
+# 主键列（按在主键中的位置排序），以及指定列上是否有单列、非部分的唯一索引
+PRIMARY_KEY_COLUMNS_SQL = "SELECT name FROM pragma_table_info(?) WHERE pk > 0 ORDER BY pk"
+UNIQUE_COLUMN_INDEX_SQL = """
+    SELECT 1
+    FROM pragma_index_list(?) AS il, pragma_index_info(il.name) AS ii
+    WHERE il."unique" AND NOT il.partial
+    GROUP BY il.seq
+    HAVING COUNT(*) = 1 AND MIN(ii.name) = ? COLLATE NOCASE
+    LIMIT 1
+"""
+
+
+@lru_cache(maxsize=16)
+def delete_subtree_sql(table_name: str, id_field: str, parent_field: str) -> str:
+    """构建删除节点及其子树的语句，按 (表名, ID字段, 父级字段) 缓存"""
+    table = quote_ident(table_name)
+    id_column = quote_ident(id_field)
+    parent_column = quote_ident(parent_field)
+    return f'''
+        DELETE FROM {table}
+        WHERE {id_column} IN (
+            WITH RECURSIVE subtree(node_id) AS (
+                SELECT {id_column} FROM {table} WHERE {id_column} = ?
+                UNION
+                SELECT t.{id_column}
+                FROM {table} t
+                JOIN subtree s ON t.{parent_column} = s.node_id
+            )
+            SELECT node_id FROM subtree
+        )
+    '''
+
+
+def check_columns(columns: Iterable[str], table_columns: frozenset) -> None:
+    """检查列名都属于表中已有的列，否则抛出 ValueError"""
+    if table_columns.issuperset(columns):
+        return
+    unknown = set(columns).difference(table_columns)
+    raise ValueError(f"Unknown column: {', '.join(sorted(unknown))}")
+
+
+def rows_to_dicts(cursor: sqlite3.Cursor, rows: List[tuple]) -> List[Dict[str, Any]]:
+    """把元组行转换为字典，列名只从 cursor.description 读取一次（比逐行 dict(sqlite3.Row) 更快）"""
+    if cursor.description is None:
+        return []
+    columns = [description[0] for description in cursor.description]
+    return [dict(zip(columns, row)) for row in rows]
+
+
+# 新建连接时执行的 PRAGMA：启用外键约束；WAL 下 NORMAL 同步只在检查点时 fsync，
+# 临时表与排序放在内存，页缓存 64 MB，并通过 mmap 读取数据库文件
+CONNECTION_PRAGMAS = (
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -64000",
+)
+
+# 内存数据库没有可映射的文件，只对文件数据库设置 mmap
+MMAP_PRAGMA = "PRAGMA mmap_size = 268435456"
+
+# 合并为一个脚本，新建连接时一次调用执行全部 PRAGMA
+CONNECTION_PRAGMA_SCRIPT = ';\n'.join(CONNECTION_PRAGMAS) + ';'
+FILE_CONNECTION_PRAGMA_SCRIPT = ';\n'.join(CONNECTION_PRAGMAS + (MMAP_PRAGMA,)) + ';'
+
+# 每个连接的预编译语句缓存容量：语句字符串按 (表, 列) 缓存后保持稳定，
+# 需容纳 insert/update/upsert/外键选项等各种列组合的语句，避免互相挤出后重新 prepare
+STATEMENT_CACHE_SIZE = 256
+
+# 每个数据库文件保留的空闲连接数上限，并发超出时临时新建连接，归还时关闭
+CONNECTION_POOL_SIZE = 8
 
 
 class DatabaseService:
@@ -19,39 +229,132 @@ class DatabaseService:
 
     def __init__(self):
         self._db_path = config.db_path
-        self._lock = RLock()
-        self._connection_cache = {}
+        self._db_path_str = config.db_path_str
+        # 数据库路径 -> 空闲连接栈（后进先出，优先复用最近使用、页缓存最热的连接）；
+        # list 的 append/pop 本身是原子操作，借出和归还都不需要获取锁
+        self._pools: Dict[str, List[sqlite3.Connection]] = {}
+        # 数据库路径 -> 写锁，同一进程内的写操作排队执行，读操作在 WAL 模式下不受影响
+        self._write_locks: Dict[str, Lock] = {}
+        self._inherited_connections = []
+        # 上次刷新列类型/外键时的 (数据库路径, 表名, schema_version)
+        self._column_types_key: Optional[Tuple[str, str, int]] = None
+        self._foreign_keys_key: Optional[Tuple[str, str, int]] = None
+        # 查询所有节点的语句：((数据库路径, 表名, schema_version, ID字段), SQL)
+        self._all_nodes_sql: Optional[Tuple[tuple, str]] = None
+        # 表的列名集合：((数据库路径, 表名, schema_version), 列名)
+        self._table_columns: Optional[Tuple[tuple, frozenset]] = None
+        # 外键选项查询语句：((数据库路径, 表名, schema_version), 外键列 -> SQL)
+        # ID 字段是否单独构成主键或唯一约束：((数据库路径, 表名, schema_version, ID字段), 结果)
+        self._id_unique: Optional[Tuple[tuple, bool]] = None
+        self._foreign_options_sql: Optional[Tuple[tuple, Dict[str, str]]] = None
+
+        # fork 出的子进程不能复用父进程的 SQLite 连接
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self) -> None:
+        """在子进程中丢弃继承的连接池，之后按需重新打开连接
+
+        继承的连接只保留引用而不关闭：在子进程中关闭（或被回收）同样会操作父进程的数据库文件状态。
+        """
+        for pool in self._pools.values():
+            self._inherited_connections.extend(pool)
+        self._pools = {}
+        self._write_locks = {}
+
+    def _open_connection(self, path: str) -> sqlite3.Connection:
+        """创建新的数据库连接，PRAGMA 只在创建时执行一次"""
+        # isolation_level=None：不由 sqlite3 模块隐式开启事务，写事务由 write_connection 显式管理
+        conn = sqlite3.connect(
+            path,
+            check_same_thread=False,
+            timeout=30.0,
+            isolation_level=None,
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+        # 启用外键约束及其余连接级 PRAGMA（sqlite3.connect 的 timeout 即 busy_timeout）
+        if path == ':memory:':
+            conn.executescript(CONNECTION_PRAGMA_SCRIPT)
+        else:
+            conn.executescript(FILE_CONNECTION_PRAGMA_SCRIPT)
+        # WAL 模式下读写互不阻塞；journal_mode 持久保存在数据库文件中，已是 WAL 时不再切换
+        if conn.execute("PRAGMA journal_mode").fetchone()[0].lower() != 'wal':
+            conn.execute("PRAGMA journal_mode = WAL")
+        return conn
+
+    def _acquire_connection(self, path: str) -> sqlite3.Connection:
+        """从连接池获取连接，池为空时新建"""
+        pool = self._pools.get(path)
+        if pool is None:
+            pool = self._pools.setdefault(path, [])
+        try:
+            return pool.pop()
+        except IndexError:
+            return self._open_connection(path)
+
+    def _release_connection(self, path: str, conn: sqlite3.Connection) -> None:
+        """将连接归还连接池，池已满时关闭连接"""
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = None
+        pool = self._pools.get(path)
+        # 上限只是软限制：并发归还时可能略微超出，不影响正确性
+        if pool is not None and len(pool) < CONNECTION_POOL_SIZE:
+            pool.append(conn)
+        else:
+            conn.close()
+
+    def bind_db_path(self) -> None:
+        """从当前配置刷新默认数据库路径"""
+        self._db_path = config.db_path
+        self._db_path_str = config.db_path_str
 
     @contextmanager
     def get_connection(self, db_path: Optional[Path] = None):
-        """获取数据库连接上下文管理器"""
-        path = db_path or self._db_path
-        path_str = str(path)
-
-        # 使用连接池
-        thread_id = id(__import__('threading').current_thread())
-        cache_key = (thread_id, path_str)
-
-        with self._lock:
-            if cache_key not in self._connection_cache:
-                self._connection_cache[cache_key] = sqlite3.connect(
-                    path_str,
-                    check_same_thread=False,
-                    timeout=30.0
-                )
-                # 启用外键约束
-                self._connection_cache[cache_key].execute("PRAGMA foreign_keys = ON")
-                # 设置行级锁定
-                self._connection_cache[cache_key].execute("PRAGMA journal_mode = WAL")
-                self._connection_cache[cache_key].execute("PRAGMA synchronous = NORMAL")
-
-            conn = self._connection_cache[cache_key]
+        """获取数据库连接上下文管理器
 
+        连接从按数据库路径划分的连接池借出，使用完毕后回滚未提交的事务并归还，而不是关闭。
+        """
+        path = self._db_path_str if db_path is None else str(db_path)
+        conn = self._acquire_connection(path)
         try:
             yield conn
-        except Exception:
-            conn.rollback()
-            raise
+        finally:
+            self._release_connection(path, conn)
+
+    @contextmanager
+    def write_connection(self, db_path: Optional[Path] = None):
+        """获取用于写操作的数据库连接上下文管理器
+
+        持有该数据库的进程内写锁：SQLite 同一时间只允许一个写事务，
+        在进程内排队可避免多个写连接在忙等待超时里轮询；读连接在 WAL 模式下照常并发读取。
+        块内的语句在同一个 BEGIN IMMEDIATE 事务中执行：开始时即取得写锁（不会在首次写入时才升级锁而遇到
+        SQLITE_BUSY），正常退出时提交，抛出异常时回滚。
+        """
+        path = self._db_path_str if db_path is None else str(db_path)
+        lock = self._write_locks.get(path)
+        if lock is None:
+            lock = self._write_locks.setdefault(path, Lock())
+        with lock:
+            with self.get_connection(path) as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    yield conn
+                except BaseException:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    raise
+                if conn.in_transaction:
+                    conn.execute("COMMIT")
+
+    def close_connections(self) -> None:
+        """关闭连接池中的所有空闲连接"""
+        for pool in self._pools.values():
+            while True:
+                try:
+                    pool.pop().close()
+                except IndexError:
+                    break
 
     def ensure_schema(self, db_path: Optional[Path] = None) -> None:
         """确保数据库表结构存在"""
@@ -60,11 +363,12 @@ class DatabaseService:
         # 确保数据库目录存在
         path.parent.mkdir(parents=True, exist_ok=True)
 
-        with self.get_connection(path) as conn:
+        with self.write_connection(path) as conn:
             cursor = conn.cursor()
 
             # 检查表是否存在
-            cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{config.table_name}'")
+            # 表名作为参数绑定：语句文本固定，可直接命中连接的预编译语句缓存
+            cursor.execute(TABLE_EXISTS_SQL, (config.table_name,))
             table_exists = cursor.fetchone()
 
             if not table_exists:
@@ -90,23 +394,16 @@ class DatabaseService:
                         VALUES (1, NULL)
                     ''')
 
-                conn.commit()
-
             # 检查并添加常用列（如果不存在）
-            self._ensure_column_exists(conn, 'name', 'TEXT DEFAULT ""')
+            self._ensure_column_exists(conn, path, 'name', 'TEXT DEFAULT ""')
             # 不要强制添加sort_order列，使用动态检测
 
-            conn.commit()
-
-    def _ensure_column_exists(self, conn: sqlite3.Connection, column_name: str, column_def: str) -> bool:
-        """确保列存在，如果不存在则添加"""
-        cursor = conn.cursor()
-        cursor.execute(f"PRAGMA table_info({config.table_name})")
-        columns = [col[1] for col in cursor.fetchall()]
-
-        if column_name not in columns:
+    def _ensure_column_exists(self, conn: sqlite3.Connection, path: Path,
+                              column_name: str, column_def: str) -> bool:
+        """确保列存在，如果不存在则添加（列名集合按表结构版本缓存，ALTER TABLE 后版本递增自动失效）"""
+        if column_name not in self._table_column_names(conn, path):
             try:
-                cursor.execute(f"ALTER TABLE {config.table_name} ADD COLUMN {column_name} {column_def}")
+                conn.execute(f"ALTER TABLE {config.table_name} ADD COLUMN {column_name} {column_def}")
                 return True
             except sqlite3.OperationalError as e:
                 if "duplicate column name" in str(e).lower():
@@ -115,71 +412,136 @@ class DatabaseService:
                 raise
         return False
 
-    def refresh_column_types(self, db_path: Optional[Path] = None) -> None:
-        """刷新列类型信息"""
+    def _schema_key(self, conn: sqlite3.Connection, path: Path) -> Tuple[str, str, int]:
+        """获取表结构版本键，SQLite 在任何结构变更（包括其他进程所做的）后递增 schema_version"""
+        schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+        return (str(path), config.table_name, schema_version)
+
+    def _table_column_names(self, conn: sqlite3.Connection, path: Path) -> frozenset:
+        """获取当前表的列名集合，表结构未变化时复用上次 PRAGMA table_info 的结果"""
+        key = self._schema_key(conn, path)
+        cached = self._table_columns
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        columns = frozenset(col[0] for col in conn.execute(TABLE_COLUMNS_SQL, (config.table_name,)))
+        self._table_columns = (key, columns)
+        return columns
+
+    def _id_field_is_unique(self, conn: sqlite3.Connection, path: Path) -> bool:
+        """ID 字段是否单独构成主键或带唯一索引，即能否作为 ON CONFLICT 的冲突目标（表结构未变化时复用结果）"""
+        key = (*self._schema_key(conn, path), config.id_field)
+        cached = self._id_unique
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        primary = [row[0] for row in conn.execute(PRIMARY_KEY_COLUMNS_SQL, (config.table_name,))]
+        unique = (
+            [name.lower() for name in primary] == [config.id_field.lower()]
+            or conn.execute(
+                UNIQUE_COLUMN_INDEX_SQL, (config.table_name, config.id_field)
+            ).fetchone() is not None
+        )
+        self._id_unique = (key, unique)
+        return unique
+
+    def refresh_column_types(self, db_path: Optional[Path] = None,
+                             conn: Optional[sqlite3.Connection] = None) -> None:
+        """刷新列类型信息（表结构未变化时跳过）；传入 conn 时复用该连接"""
         path = db_path or self._db_path
-
-        with self.get_connection(path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(f"PRAGMA table_info({config.table_name})")
-            columns = cursor.fetchall()
-
-            config.COLUMN_TYPES = {}
-            for col in columns:
-                _, col_name, col_type, _, _, _ = col
-                col_type_upper = col_type.upper()
-                if any(hint in col_type_upper for hint in config.INTEGER_TYPE_HINTS):
-                    config.COLUMN_TYPES[col_name] = 'integer'
-                elif any(hint in col_type_upper for hint in config.FLOAT_TYPE_HINTS):
-                    config.COLUMN_TYPES[col_name] = 'float'
-                elif any(hint in col_type_upper for hint in config.BOOLEAN_TYPE_HINTS):
-                    config.COLUMN_TYPES[col_name] = 'boolean'
-                else:
-                    config.COLUMN_TYPES[col_name] = 'text'
-
-    def refresh_foreign_keys(self, db_path: Optional[Path] = None) -> None:
-        """刷新外键信息"""
+        if conn is None:
+            with self.get_connection(path) as conn:
+                self.refresh_column_types(path, conn)
+            return
+
+        key = self._schema_key(conn, path)
+        if key != self._column_types_key:
+            self._load_column_types(conn, key)
+
+    def refresh_foreign_keys(self, db_path: Optional[Path] = None,
+                             conn: Optional[sqlite3.Connection] = None) -> None:
+        """刷新外键信息（表结构未变化时跳过）；传入 conn 时复用该连接"""
         path = db_path or self._db_path
-
-        with self.get_connection(path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(f"PRAGMA foreign_key_list({config.table_name})")
-            fks = cursor.fetchall()
-
-            config.FOREIGN_KEYS = {}
-            for fk in fks:
-                _, _, table, from_col, to_col, _, _, _ = fk
-                config.FOREIGN_KEYS[from_col] = {
-                    'table': table,
-                    'column': to_col
-                }
+        if conn is None:
+            with self.get_connection(path) as conn:
+                self.refresh_foreign_keys(path, conn)
+            return
+
+        key = self._schema_key(conn, path)
+        if key != self._foreign_keys_key:
+            self._load_foreign_keys(conn, key)
+
+    def refresh_metadata(self, db_path: Optional[Path] = None,
+                         conn: Optional[sqlite3.Connection] = None) -> None:
+        """刷新列类型和外键信息：同一连接上只读取一次 schema_version，两者都是最新时直接返回"""
+        path = db_path or self._db_path
+        if conn is None:
+            with self.get_connection(path) as conn:
+                self.refresh_metadata(path, conn)
+            return
+
+        key = self._schema_key(conn, path)
+        if key != self._column_types_key:
+            self._load_column_types(conn, key)
+        if key != self._foreign_keys_key:
+            self._load_foreign_keys(conn, key)
+
+    def _load_column_types(self, conn: sqlite3.Connection, key: Tuple[str, str, int]) -> None:
+        """读取列类型并整体替换，并发读取的请求不会看到半成品
+
+        同一次 PRAGMA table_info 的结果顺带填充列名集合缓存，写入节点时不再单独查询。
+        """
+        columns = conn.execute(TABLE_COLUMNS_SQL, (config.table_name,)).fetchall()
+        column_types = {name: column_type_category(col_type) for name, col_type in columns}
+        config.COLUMN_TYPES = column_types
+        self._column_types_key = key
+        self._table_columns = (key, frozenset(column_types))
+
+    def _load_foreign_keys(self, conn: sqlite3.Connection, key: Tuple[str, str, int]) -> None:
+        """读取外键信息并整体替换"""
+        foreign_keys = {}
+        for table, from_col, to_col in conn.execute(FOREIGN_KEY_LIST_SQL, (config.table_name,)):
+            foreign_keys[from_col] = {
+                'table': table,
+                'column': to_col
+            }
+
+        config.FOREIGN_KEYS = foreign_keys
+        self._foreign_keys_key = key
+
+    def meta_version(self) -> Tuple[Optional[Tuple[str, str, int]], Optional[Tuple[str, str, int]]]:
+        """获取当前列类型与外键信息对应的表结构版本键，任一信息刷新后版本随之改变"""
+        return (self._column_types_key, self._foreign_keys_key)
 
     def collect_unique_info(self, conn: sqlite3.Connection, table_name: str) -> Dict[str, str]:
-        """收集唯一列信息"""
-        cursor = conn.cursor()
+        """收集唯一列信息
+
+        通过表值 PRAGMA 函数各用一条查询取得主键列和第一个单列唯一索引，
+        不再对每个唯一索引单独执行 PRAGMA index_info。
+        """
         info = {}
 
         # 主键
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        columns = cursor.fetchall()
-        for col in columns:
-            _, col_name, _, _, _, is_pk = col
-            if is_pk:
-                info['primary'] = col_name
-                break
+        row = conn.execute(
+            "SELECT name FROM pragma_table_info(?) WHERE pk > 0 LIMIT 1", (table_name,)
+        ).fetchone()
+        if row:
+            info['primary'] = row[0]
 
         # 唯一约束
-        cursor.execute(f"PRAGMA index_list({table_name})")
-        indexes = cursor.fetchall()
-        for idx in indexes:
-            _, idx_name, is_unique, _, _ = idx
-            if is_unique:
-                cursor.execute(f"PRAGMA index_info({idx_name})")
-                idx_cols = cursor.fetchall()
-                if len(idx_cols) == 1:
-                    _, _, col_name = idx_cols[0]
-                    info['unique'] = col_name
-                    break
+        row = conn.execute(
+            """
+            SELECT MIN(ii.name)
+            FROM pragma_index_list(?) AS il, pragma_index_info(il.name) AS ii
+            WHERE il."unique"
+            GROUP BY il.seq
+            HAVING COUNT(*) = 1
+            ORDER BY il.seq
+            LIMIT 1
+            """,
+            (table_name,)
+        ).fetchone()
+        if row:
+            info['unique'] = row[0]
 
         return info
 
@@ -188,47 +550,65 @@ class DatabaseService:
         """获取外键选项"""
         path = db_path or self._db_path
 
-        if column not in config.FOREIGN_KEYS:
+        # 只读取一次 FOREIGN_KEYS：刷新时整体替换字典，两次读取之间可能换成新字典
+        fk_info = config.FOREIGN_KEYS.get(column)
+        if fk_info is None:
             return []
 
-        fk_info = config.FOREIGN_KEYS[column]
-        foreign_table = fk_info['table']
-        foreign_column = fk_info['column']
-
         with self.get_connection(path) as conn:
-            cursor = conn.cursor()
-
-            # 获取主键和唯一列信息
-            unique_info = self.collect_unique_info(conn, foreign_table)
-            label_column = unique_info.get('unique', unique_info.get('primary', foreign_column))
+            cursor = conn.execute(self._foreign_options_query(conn, path, column, fk_info), (limit,))
+
+            # 直接迭代游标构建结果，不先 fetchall 出中间列表；标签为空串时才格式化 "ID {value}"
+            return [
+                {'value': str(value), 'label': str(label) or f"ID {value}"}
+                for value, label in cursor
+            ]
+
+    def _foreign_options_query(self, conn: sqlite3.Connection, path: Path, column: str,
+                               fk_info: Dict[str, str]) -> str:
+        """获取外键选项的查询语句（表结构未变化时复用，不再每次执行 PRAGMA 查找标签列）"""
+        key = self._schema_key(conn, path)
+        cached = self._foreign_options_sql
+        if cached is None or cached[0] != key:
+            cached = (key, {})
+            self._foreign_options_sql = cached
+        sql = cached[1].get(column)
+        if sql is not None:
+            return sql
 
-            # 查询数据
-            cursor.execute(f'''
-                SELECT {foreign_column}, {label_column}
-                FROM {foreign_table}
-                ORDER BY {label_column}
-                LIMIT ?
-            ''', (limit,))
-
-            results = []
-            for value, label in cursor.fetchall():
-                results.append({
-                    'value': str(value),
-                    'label': str(label) or f"ID {value}"
-                })
+        foreign_table = fk_info['table']
 
-        return results
+        # 获取主键和唯一列信息
+        unique_info = self.collect_unique_info(conn, foreign_table)
+        # 外键未写明被引用列（REFERENCES t）时引用的是对方主键
+        foreign_column = fk_info['column'] or unique_info.get('primary', 'rowid')
+        label_column = unique_info.get('unique', unique_info.get('primary', foreign_column))
+
+        # 表名与列名来自 PRAGMA 和用户的表结构，与其他缓存的 SQL 一样引用后再拼接
+        value_ident = quote_ident(foreign_column)
+        label_ident = quote_ident(label_column)
+        sql = f'''
+            SELECT {value_ident}, {label_ident}
+            FROM {quote_ident(foreign_table)}
+            ORDER BY {label_ident}
+            LIMIT ?
+        '''
+        cached[1][column] = sql
+        return sql
 
     def rebuild_sort_order(self, db_path: Optional[Path] = None) -> None:
         """重建排序"""
         path = db_path or self._db_path
 
-        with self.get_connection(path) as conn:
+        table = quote_ident(config.table_name)
+        id_column = quote_ident(config.id_field)
+        parent_column = quote_ident(config.parent_field)
+
+        with self.write_connection(path) as conn:
             cursor = conn.cursor()
 
             # 检查是否有sort_order列
-            cursor.execute(f"PRAGMA table_info({config.table_name})")
-            columns = [col[1] for col in cursor.fetchall()]
+            columns = self._table_column_names(conn, path)
 
             # 如果没有排序列，尝试添加一个
             sort_column = None
@@ -239,38 +619,47 @@ class DatabaseService:
 
             if not sort_column:
                 # 添加sort_order列
-                cursor.execute(f"ALTER TABLE {config.table_name} ADD COLUMN sort_order INTEGER DEFAULT 0")
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN sort_order INTEGER DEFAULT 0")
                 sort_column = 'sort_order'
 
+            if SUPPORTS_UPDATE_FROM:
+                # 按层级排序并编号，一条 UPDATE ... FROM 写回所有节点
+                cursor.execute(sort_rebuild_sql(
+                    config.table_name, config.id_field, config.parent_field, sort_column
+                ))
+                return
+
             # 获取所有节点，按层级排序
+            sort_ident = quote_ident(sort_column)
             cursor.execute(f'''
-                WITH RECURSIVE tree_path AS (
-                    SELECT {config.id_field}, {config.parent_field}, 0 as depth
-                    FROM {config.table_name}
-                    WHERE {config.parent_field} IS NULL
+                WITH RECURSIVE tree_path(node_id, parent_id, sort_value, depth) AS (
+                    SELECT {id_column}, {parent_column}, {sort_ident}, 0
+                    FROM {table}
+                    WHERE {parent_column} IS NULL
                     UNION ALL
-                    SELECT t.{config.id_field}, t.{config.parent_field}, tp.depth + 1
-                    FROM {config.table_name} t
-                    JOIN tree_path tp ON t.{config.parent_field} = tp.{config.id_field}
+                    SELECT t.{id_column}, t.{parent_column}, t.{sort_ident}, tp.depth + 1
+                    FROM {table} t
+                    JOIN tree_path tp ON t.{parent_column} = tp.node_id
                 )
-                SELECT {config.id_field}
+                SELECT node_id, sort_value
                 FROM tree_path
-                ORDER BY depth, {config.parent_field}, {config.id_field}
+                ORDER BY depth, parent_id, node_id
             ''')
 
-            nodes = cursor.fetchall()
-            sort_order = 10
-
-            # 更新排序值
-            for (node_id,) in nodes:
-                cursor.execute(f'''
-                    UPDATE {config.table_name}
-                    SET {sort_column} = ?
-                    WHERE {config.id_field} = ?
-                ''', (sort_order, node_id))
-                sort_order += 10
-
-            conn.commit()
+            # 只更新排序值发生变化的节点
+            cursor.executemany(
+                f"UPDATE {table} SET {sort_ident} = ? WHERE {id_column} = ?",
+                [
+                    (index * 10, node_id)
+                    for index, (node_id, current) in enumerate(cursor.fetchall(), 1)
+                    if current != index * 10
+                ]
+            )
+
+    def optimize(self, db_path: Optional[Path] = None) -> None:
+        """执行 PRAGMA optimize，由 SQLite 按需对统计信息过期的表运行 ANALYZE"""
+        with self.write_connection(db_path) as conn:
+            conn.execute("PRAGMA optimize")
 
     def execute_query(self, query: str, params: Tuple = (),
                      db_path: Optional[Path] = None) -> List[Dict[str, Any]]:
@@ -278,83 +667,153 @@ class DatabaseService:
         path = db_path or self._db_path
 
         with self.get_connection(path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            return [dict(row) for row in cursor.fetchall()]
+            cursor = conn.execute(query, params)
+            return rows_to_dicts(cursor, cursor.fetchall())
 
     def execute_update(self, query: str, params: Tuple = (),
                       db_path: Optional[Path] = None) -> int:
         """执行更新"""
         path = db_path or self._db_path
 
-        with self.get_connection(path) as conn:
+        with self.write_connection(path) as conn:
             cursor = conn.cursor()
             cursor.execute(query, params)
-            conn.commit()
             return cursor.rowcount
 
     def get_all_nodes(self, db_path: Optional[Path] = None) -> List[Dict[str, Any]]:
-        """获取所有节点"""
+        """获取所有节点
+
+        按批转换为字典，不会同时持有全部 sqlite3.Row 与全部字典两份结果。
+        """
+        return list(self.iter_all_nodes(db_path))
+
+    def iter_all_nodes(self, db_path: Optional[Path] = None) -> Iterator[Dict[str, Any]]:
+        """逐行获取所有节点（生成器，不一次性构建整个结果列表）"""
+        for batch in self.iter_node_batches(db_path=db_path):
+            yield from batch
+
+    def iter_node_batches(self, batch_size: int = NODE_BATCH_SIZE,
+                          db_path: Optional[Path] = None) -> Iterator[List[Dict[str, Any]]]:
+        """按批获取所有节点（生成器，每批最多 batch_size 行）"""
         path = db_path or self._db_path
 
         with self.get_connection(path) as conn:
-            # 先设置 row_factory
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-
-            # 检查是否有排序列
-            cursor.execute(f"PRAGMA table_info({config.table_name})")
-            columns = [col[1] for col in cursor.fetchall()]
+            cursor = conn.execute(self._all_nodes_query(conn, path))
 
-            # 动态构建ORDER BY子句
-            order_by = config.id_field
-            for possible_sort_col in ['sort_order', 'sort', 'sortorder', 'order_by']:
-                if possible_sort_col in columns:
-                    order_by = f"{possible_sort_col}, {config.id_field}"
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
                     break
+                yield rows_to_dicts(cursor, rows)
+
+    def _all_nodes_query(self, conn: sqlite3.Connection, path: Path) -> str:
+        """获取查询所有节点的语句，存在排序列时按排序列排序（表结构未变化时复用上次构建的语句）"""
+        key = (*self._schema_key(conn, path), config.id_field)
+        cached = self._all_nodes_sql
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        # 检查是否有排序列
+        columns = self._table_column_names(conn, path)
+
+        # 动态构建ORDER BY子句
+        order_by = config.id_field
+        for possible_sort_col in ['sort_order', 'sort', 'sortorder', 'order_by']:
+            if possible_sort_col in columns:
+                order_by = f"{possible_sort_col}, {config.id_field}"
+                break
 
-            query = f"SELECT * FROM {config.table_name} ORDER BY {order_by}"
-            cursor.execute(query)
-
-            return [dict(row) for row in cursor.fetchall()]
+        sql = f"SELECT * FROM {config.table_name} ORDER BY {order_by}"
+        self._all_nodes_sql = (key, sql)
+        return sql
 
     def create_node(self, data: Dict[str, Any],
                    db_path: Optional[Path] = None) -> int:
-        """创建节点"""
-        columns = list(data.keys())
-        placeholders = ', '.join(['?' for _ in columns])
-        query = f'''
-            INSERT INTO {config.table_name} ({', '.join(columns)})
-            VALUES ({placeholders})
-        '''
-        with self.get_connection(db_path) as conn:
+        """创建节点，数据中包含表中不存在的列时抛出 ValueError"""
+        columns = tuple(data)
+        query = insert_sql(config.table_name, columns)
+        path = db_path or self._db_path
+        with self.write_connection(path) as conn:
+            check_columns(columns, self._table_column_names(conn, path))
             cursor = conn.cursor()
             cursor.execute(query, list(data.values()))
-            conn.commit()
             return cursor.lastrowid
 
     def update_node(self, node_id: int, data: Dict[str, Any],
                    db_path: Optional[Path] = None) -> int:
-        """更新节点"""
+        """更新节点，数据中包含表中不存在的列时抛出 ValueError"""
         if not data:
             return 0
 
-        set_clause = ', '.join([f"{k} = ?" for k in data.keys()])
-        query = f'''
-            UPDATE {config.table_name}
-            SET {set_clause}, updated_at = CURRENT_TIMESTAMP
-            WHERE {config.id_field} = ?
-        '''
-        params = list(data.values()) + [node_id]
-        return self.execute_update(query, tuple(params), db_path)
+        columns = tuple(data)
+        query = update_sql(config.table_name, config.id_field, columns)
+        path = db_path or self._db_path
+        with self.write_connection(path) as conn:
+            check_columns(columns, self._table_column_names(conn, path))
+            return conn.execute(query, (*data.values(), node_id)).rowcount
+
+    def bulk_upsert(self, rows: Iterable[Dict[str, Any]],
+                    db_path: Optional[Path] = None) -> int:
+        """批量恢复节点
+
+        每行的 'id' 为节点ID：已存在的节点更新给定列，不存在的节点按原ID插入。
+        ID 字段没有主键或唯一约束时不能使用 ON CONFLICT，改为先按ID批量更新、再插入表中仍不存在的ID。
+        rows 可以是生成器：每累积 UPSERT_BATCH_SIZE 行按列集合分组后用 executemany 写入，
+        全部批次在同一个事务内提交。行中包含表中不存在的列（或生成器抛出 ValueError）时
+        抛出 ValueError，整个事务回滚，不写入任何数据。
+        """
+        rows = iter(rows)
+        batch = list(islice(rows, UPSERT_BATCH_SIZE))
+        if not batch:
+            return 0
+
+        total = 0
+        path = db_path or self._db_path
+        with self.write_connection(path) as conn:
+            cursor = conn.cursor()
+            table_columns = self._table_column_names(conn, path)
+            has_updated_at = 'updated_at' in table_columns
+            id_unique = self._id_field_is_unique(conn, path)
+
+            while batch:
+                total += self._upsert_batch(cursor, batch, table_columns, has_updated_at, id_unique)
+                batch = list(islice(rows, UPSERT_BATCH_SIZE))
+
+        return total
+
+    def _upsert_batch(self, cursor: sqlite3.Cursor, batch: List[Dict[str, Any]],
+                      table_columns: frozenset, has_updated_at: bool, id_unique: bool) -> int:
+        """按列集合分组写入一批行，返回写入的行数"""
+        # ID 列由 'id' 提供；行中同时带有 ID 字段本身时忽略该键，避免插入语句中出现重复列
+        id_keys = ('id', config.id_field)
+        groups: Dict[Tuple[str, ...], List[tuple]] = {}
+        for row in batch:
+            columns = tuple(sorted(key for key in row if key not in id_keys))
+            groups.setdefault(columns, []).append(
+                (row['id'], *[row[column] for column in columns])
+            )
+
+        for columns in groups:
+            check_columns(columns, table_columns)
+
+        for columns, params in groups.items():
+            if id_unique:
+                sql = upsert_sql(config.table_name, config.id_field, columns, has_updated_at)
+                cursor.executemany(sql, params)
+                continue
+            update, insert = upsert_fallback_sql(config.table_name, config.id_field, columns, has_updated_at)
+            if update is not None:
+                cursor.executemany(update, [(*values, node_id) for node_id, *values in params])
+            cursor.executemany(insert, [(*row, row[0]) for row in params])
+        return len(batch)
 
     def delete_node(self, node_id: int, db_path: Optional[Path] = None) -> int:
-        """删除节点"""
-        query = f'''
-            DELETE FROM {config.table_name}
-            WHERE {config.id_field} = ?
-        '''
+        """删除节点及其所有子节点
+
+        子树由递归 CTE 在同一条 DELETE 语句中求出；UNION 去重，数据中存在环时也会终止。
+        返回删除的行数，节点不存在时为 0。
+        """
+        query = delete_subtree_sql(config.table_name, config.id_field, config.parent_field)
         return self.execute_update(query, (node_id,), db_path)
 
     def get_table_list(self, db_path: str) -> List[str]:
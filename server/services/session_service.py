@@ -4,9 +4,11 @@ Session Service - 会话服务
 遵循单一职责原则：只负责会话管理
 """
 
+import heapq
+import time
 from datetime import datetime
-from threading import RLock
-from typing import Dict, Optional, Any, List
+from threading import Lock, Condition
+from typing import Dict, Optional, Any, List, Tuple
 from contextlib import contextmanager
 
 from models.session import SessionRecord, SessionConflictError, SessionNotFoundError
@@ -19,8 +21,12 @@ class SessionService:
     def __init__(self):
         self._sessions: Dict[str, SessionRecord] = {}
         self._resource_locks: Dict[tuple, str] = {}
-        self._lock = RLock()
+        # 普通互斥锁（不可重入）：持锁的方法之间不互相调用，需要时使用 *_locked 变体
+        self._lock = Lock()
         self._session_timeout = config.SESSION_TIMEOUT_SECONDS
+        # 过期调度：(到期的monotonic时间, 会话ID) 最小堆，条件变量与 _lock 共用
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._expiry_cond = Condition(self._lock)
 
     def create_session(self, config_payload: Dict[str, Any]) -> SessionRecord:
         """创建新会话"""
@@ -29,16 +35,14 @@ class SessionService:
         resource_key = config.make_resource_key(normalized)
 
         with self._lock:
-            self._cleanup_expired_sessions()
-
-            # 检查资源冲突
-            owner = self._resource_locks.get(resource_key)
-            if owner and owner in self._sessions:
+            # 检查资源冲突（已过期的占用者就地回收，其余过期会话由清理线程处理）
+            if self._live_owner_locked(resource_key):
                 raise SessionConflictError()
 
             # 保存会话
             self._sessions[session.id] = session
             self._resource_locks[resource_key] = session.id
+            self._schedule_expiry(session)
 
         return session
 
@@ -47,8 +51,10 @@ class SessionService:
         normalized = self._normalize_config_payload(config_payload)
 
         with self._lock:
-            self._cleanup_expired_sessions()
             session = self._sessions.get(session_id)
+            if session and self._is_expired(session):
+                self._expire_locked([session_id])
+                session = None
 
             if not session:
                 raise SessionNotFoundError()
@@ -59,7 +65,7 @@ class SessionService:
 
             # 处理资源锁定
             if new_key != old_key:
-                owner = self._resource_locks.get(new_key)
+                owner = self._live_owner_locked(new_key)
                 if owner and owner != session_id:
                     if owner in self._sessions:
                         if not force:
@@ -94,15 +100,29 @@ class SessionService:
         if not session_id:
             return None
 
-        with self._lock:
-            self._cleanup_expired_sessions()
-            session = self._sessions.get(session_id)
+        # 命中路径不加锁：字典读取和浮点时间戳赋值在 CPython 中都是原子的；
+        # 只有请求的会话已过期需要删除时才持锁，其余过期会话由清理线程按到期时间回收
+        session = self._sessions.get(session_id)
+        if not session:
+            return None
+
+        if self._is_expired(session):
+            with self._lock:
+                if self._sessions.get(session_id) is session:
+                    self._expire_locked([session_id])
+            return None
 
-            if session and touch:
-                session.touch()
+        if touch:
+            session.touch()
 
         return session
 
+    def is_live(self, session_id: str, session: SessionRecord) -> bool:
+        """无锁复核会话是否仍然有效（仍登记在册且未过期），供调用方的短期缓存使用"""
+        if self._sessions.get(session_id) is not session:
+            return False
+        return self._session_timeout <= 0 or not session.is_expired(self._session_timeout)
+
     @contextmanager
     def session_context(self, session_id: str, *, refresh_meta: bool = False,
                        ensure_schema_required: bool = False):
@@ -125,55 +145,140 @@ class SessionService:
     def get_all_sessions(self) -> List[Dict[str, Any]]:
         """获取所有会话信息"""
         with self._lock:
-            self._cleanup_expired_sessions()
-            return [session.to_dict() for session in self._sessions.values()]
+            # 一次遍历同时区分有效会话与过期会话，不再先清理再复制
+            cutoff = self._expiry_cutoff()
+            sessions = []
+            expired = []
+            for session_id, session in self._sessions.items():
+                if session.last_seen_ts < cutoff:
+                    expired.append(session_id)
+                else:
+                    sessions.append(session)
+            if expired:
+                self._expire_locked(expired)
+        # 序列化在锁外进行，持锁时间与会话配置大小无关
+        return [session.to_dict() for session in sessions]
 
     def cleanup_expired_sessions(self, now: Optional[datetime] = None) -> int:
-        """清理过期会话"""
+        """清理过期会话（过期按 monotonic 时钟判断，now 参数仅为兼容保留）"""
+        with self._lock:
+            return self._cleanup_expired_sessions()
+
+    def _cleanup_expired_sessions(self) -> int:
+        """内部清理过期会话（需持有锁），返回清理数量
+
+        只从到期堆中弹出已到期的条目，不再遍历全部会话。
+        """
         if self._session_timeout <= 0:
             return 0
 
-        reference = now or datetime.utcnow()
-        expired_sessions = []
+        expired_sessions = self._pop_expired_ids_locked()
+        return self._expire_locked(expired_sessions) if expired_sessions else 0
 
-        with self._lock:
-            for session_id, session in list(self._sessions.items()):
-                if session.is_expired(self._session_timeout):
-                    expired_sessions.append(session_id)
-
-            # 删除过期会话
-            for session_id in expired_sessions:
-                session = self._sessions.get(session_id)
-                if session:
-                    resource_key = config.make_resource_key(session.config)
-                    self._resource_locks.pop(resource_key, None)
-                    del self._sessions[session_id]
-
-        return len(expired_sessions)
-
-    def _cleanup_expired_sessions(self) -> None:
-        """内部清理过期会话（带锁）"""
+    def _expiry_cutoff(self) -> float:
+        """只读取一次时钟：最后活跃时间早于该时刻的会话即已过期，未启用超时时为负无穷"""
         if self._session_timeout <= 0:
-            return
+            return float('-inf')
+        return time.monotonic() - self._session_timeout
+
+    def _is_expired(self, session: SessionRecord) -> bool:
+        """检查会话是否已过期"""
+        return self._session_timeout > 0 and session.is_expired(self._session_timeout)
 
-        reference = datetime.utcnow()
-        expired_sessions = []
+    def _live_owner_locked(self, resource_key: tuple) -> Optional[str]:
+        """获取资源的有效占用者（需持有锁），占用者已过期时将其删除并返回 None"""
+        owner = self._resource_locks.get(resource_key)
+        if not owner:
+            return None
+        session = self._sessions.get(owner)
+        if session is None:
+            return None
+        if self._is_expired(session):
+            self._expire_locked([owner])
+            return None
+        return owner
 
-        for session_id, session in list(self._sessions.items()):
-            if session.is_expired(self._session_timeout):
-                expired_sessions.append(session_id)
+    def _schedule_expiry(self, session: SessionRecord) -> None:
+        """登记会话的到期时间（需持有锁）
 
-        # 删除过期会话
-        for session_id in expired_sessions:
+        只有新的到期时间成为最近的到期时间时才唤醒清理线程；否则清理线程已在等待更早的时间，唤醒只会空转一轮。
+        """
+        if self._session_timeout <= 0:
+            return
+        deadline = time.monotonic() + session.expires_in(self._session_timeout)
+        entry = (deadline, session.id)
+        heapq.heappush(self._expiry_heap, entry)
+        if self._expiry_heap[0] is entry:
+            self._expiry_cond.notify()
+
+    def wait_for_next_expiry(self) -> None:
+        """阻塞直到最近的会话到期时间，或在出现更早的到期时间、wake_cleanup_worker 时被唤醒"""
+        with self._expiry_cond:
+            self._wait_for_next_expiry_locked()
+
+    def _wait_for_next_expiry_locked(self) -> None:
+        """等待最近的会话到期时间（需持有锁，等待期间释放）"""
+        timeout = None
+        if self._expiry_heap:
+            timeout = max(0.0, self._expiry_heap[0][0] - time.monotonic())
+        self._expiry_cond.wait(timeout)
+
+    def wake_cleanup_worker(self) -> None:
+        """唤醒等待中的清理线程（用于停止应用）"""
+        with self._expiry_cond:
+            self._expiry_cond.notify_all()
+
+    def pop_expired_ids(self) -> List[str]:
+        """弹出所有已到期的会话ID，仍然活跃的会话按最新活跃时间重新登记"""
+        with self._lock:
+            return self._pop_expired_ids_locked()
+
+    def _pop_expired_ids_locked(self) -> List[str]:
+        """弹出所有已到期的会话ID（需持有锁）"""
+        expired = []
+        now = time.monotonic()
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            _, session_id = heapq.heappop(self._expiry_heap)
             session = self._sessions.get(session_id)
+            if not session:
+                continue
+            remaining = session.expires_in(self._session_timeout)
+            if remaining < 0:
+                expired.append(session_id)
+            else:
+                heapq.heappush(self._expiry_heap, (now + remaining, session_id))
+        return expired
+
+    def expire(self, session_ids: List[str]) -> int:
+        """批量删除会话并释放其资源锁"""
+        with self._lock:
+            return self._expire_locked(session_ids)
+
+    def _expire_locked(self, session_ids: List[str]) -> int:
+        """批量删除会话并释放其资源锁（需持有锁）"""
+        removed = 0
+        for session_id in session_ids:
+            session = self._sessions.pop(session_id, None)
             if session:
                 resource_key = config.make_resource_key(session.config)
                 self._resource_locks.pop(resource_key, None)
-                del self._sessions[session_id]
+                removed += 1
+        return removed
+
+    def run_expiry_cycle(self) -> int:
+        """等待最近的到期时间，然后一次性清理所有到期会话，返回清理数量
+
+        被唤醒时已经持有锁，弹出与删除在同一次持锁内完成，不再为每一步重新竞争会话锁，
+        弹出与删除之间也不会有请求插入。
+        """
+        with self._expiry_cond:
+            self._wait_for_next_expiry_locked()
+            expired = self._pop_expired_ids_locked()
+            return self._expire_locked(expired) if expired else 0
 
     def _build_session_record(self, config: Dict[str, Any]) -> SessionRecord:
-        """构建会话记录"""
-        return SessionRecord(config=config.copy())
+        """构建会话记录（config 来自 _normalize_config_payload，已是新字典，无需复制）"""
+        return SessionRecord(config=config)
 
     def _normalize_config_payload(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         """规范化配置载荷"""
@@ -0,0 +1,99 @@
+"""
+Static File Service - 静态文件服务
+负责静态文件内容的内存缓存与有效性校验
+遵循单一职责原则：只负责静态文件缓存
+"""
+
+import os
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Optional, Tuple
+
+
+# 缓存总容量上限，超出后按最近最少使用淘汰
+STATIC_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# 单个文件的缓存上限，更大的文件直接以 sendfile 流式发送
+STATIC_CACHE_MAX_ENTRY_BYTES = 4 * 1024 * 1024
+
+
+def make_etag(st: os.stat_result) -> str:
+    """根据文件大小和修改时间生成 ETag"""
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """检查 If-None-Match 是否命中 ETag（支持多个值、'*' 以及弱比较的 W/ 前缀）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class StaticFileService:
+    """静态文件服务 - 单一职责：缓存热点静态文件内容"""
+
+    def __init__(self, max_bytes: int = STATIC_CACHE_MAX_BYTES,
+                 max_entry_bytes: int = STATIC_CACHE_MAX_ENTRY_BYTES):
+        # 路径 -> (st_mtime_ns, st_size, 文件内容)
+        self._entries: 'OrderedDict[str, Tuple[int, int, bytes]]' = OrderedDict()
+        self._total_bytes = 0
+        self._max_bytes = max_bytes
+        self._max_entry_bytes = max_entry_bytes
+        self._lock = Lock()
+
+    def get_content(self, file_path: Path, st: os.stat_result) -> Optional[bytes]:
+        """获取文件内容，修改时间与大小未变时直接返回缓存
+
+        文件超过单项上限时返回 None，由调用方流式发送。
+        """
+        if st.st_size > self._max_entry_bytes:
+            return None
+
+        key = str(file_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+                self._entries.move_to_end(key)
+                return entry[2]
+
+        with open(file_path, 'rb') as f:
+            content = f.read()
+
+        # 读取期间文件被改写时不缓存，下次请求重新读取
+        if len(content) != st.st_size:
+            return content
+
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (st.st_mtime_ns, st.st_size, content)
+            self._total_bytes += len(content)
+            while self._total_bytes > self._max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted[2])
+
+        return content
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def _discard(self, key: str) -> None:
+        """移除缓存项（需持有锁）"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= len(entry[2])
+
+
+# 全局静态文件服务实例
+static_file_service = StaticFileService()
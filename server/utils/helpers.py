@@ -6,12 +6,56 @@ Helper Functions - 工具函数模块
 
 import json
 import os
+import re
+import tempfile
+import threading
+from datetime import date
+from functools import lru_cache
+from http import HTTPStatus
 from pathlib import Path
-from typing import Dict, Any, List, Optional, Union, Tuple
-from urllib.parse import unquote, parse_qs, urlparse
+from typing import BinaryIO, Dict, Any, Iterator, List, NamedTuple, Optional, Union, Tuple
+from urllib.parse import unquote, unquote_plus, parse_qs, urlparse
 
 from config.settings import config
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+# JSON 请求体的大小上限
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+# 数据库上传路由及其请求体上限：异步与 io_uring 前端把请求体整体读入内存后再交给处理器，
+# 上传不受 JSON 上限约束，但仍需有界
+UPLOAD_PATH = '/api/upload'
+MAX_UPLOAD_BYTES = 512 * 1024 * 1024
+
+# 每个线程复用的请求体缓冲区大小上限，更大的请求体临时分配，不长期占用内存
+BODY_BUFFER_MAX_BYTES = 1024 * 1024
+
+# 安装了 ijson 时，不小于该大小的 JSON 请求体边读取边解析，不整体读入内存
+STREAMING_JSON_MIN_BYTES = 64 * 1024
+
+# multipart 上传每次读取的块大小与单个分段头的大小上限；
+# 较大的块减少大文件上传时 read/write 系统调用和分隔符查找的次数，每个上传最多占用约一个块的内存
+MULTIPART_CHUNK_SIZE = 1024 * 1024
+MULTIPART_MAX_HEADER_BYTES = 16 * 1024
+
+_MULTIPART_FILENAME = re.compile(r'filename="([^"]*)"')
+
+# 路径中 session 段之后的会话ID：.../session/{sessionId}
+_SESSION_PATH = re.compile(r'(?:^|/)session/([^/]+)')
+
+# 连续的斜杠
+_SLASH_RUN = re.compile(r'/{2,}')
+
 
 def sanitize_payload(payload: bytes) -> str:
     """清理载荷数据"""
@@ -31,39 +75,65 @@ def looks_like_int(value: str) -> bool:
     return value.isdigit()
 
 
+def parse_node_id(value: str) -> Optional[int]:
+    """解析路径中的节点ID，非十进制数字时返回 None（不经过异常）"""
+    return int(value) if value.isascii() and value.isdigit() else None
+
+
 def coerce_to_int(value: str) -> Optional[int]:
-    """将字符串强制转换为整数"""
+    """将字符串强制转换为整数
+
+    先直接按整数解析（不经过 float，大整数不损失精度），失败时再按浮点数截断。
+    """
     try:
-        return int(float(value))
+        return int(value)
     except (ValueError, TypeError):
+        pass
+    try:
+        return int(float(value))
+    except (ValueError, TypeError, OverflowError):
         return None
 
 
-def normalize_incoming_value(key: str, value: Any) -> Any:
-    """规范化输入值"""
-    if value is None:
+def _normalize_integer(value: Any) -> Optional[int]:
+    """规范化整数列的值，已是整数时直接返回（不经过字符串往返，也不损失大整数精度）"""
+    if type(value) is int:
+        return value
+    return coerce_to_int(str(value).strip())
+
+
+def _normalize_float(value: Any) -> Optional[float]:
+    """规范化浮点列的值"""
+    if type(value) in (int, float):
+        return float(value)
+    try:
+        return float(str(value).strip())
+    except ValueError:
         return None
 
-    if key in config.COLUMN_TYPES:
-        target_type = config.COLUMN_TYPES[key]
-        str_value = str(value).strip()
 
-        if target_type == 'integer':
-            return coerce_to_int(str_value)
-        elif target_type == 'float':
-            try:
-                return float(str_value)
-            except ValueError:
-                return None
-        elif target_type == 'boolean':
-            if str_value.lower() in config.TRUTHY_STRINGS:
-                return True
-            elif str_value.lower() in config.FALSY_STRINGS:
-                return False
-            else:
-                return None
+def _normalize_boolean(value: Any) -> Optional[bool]:
+    """规范化布尔列的值"""
+    if type(value) is bool:
+        return value
+    return config.BOOL_STRINGS.get(str(value).strip().lower())
+
+
+# 列类型分类 -> 规范化函数；text 及未知列原样返回
+_TYPE_NORMALIZERS = {
+    'integer': _normalize_integer,
+    'float': _normalize_float,
+    'boolean': _normalize_boolean,
+}
 
-    return value
+
+def normalize_incoming_value(key: str, value: Any) -> Any:
+    """规范化输入值：按列类型分类一次字典查找取得规范化函数"""
+    if value is None:
+        return None
+
+    normalizer = _TYPE_NORMALIZERS.get(config.COLUMN_TYPES.get(key))
+    return value if normalizer is None else normalizer(value)
 
 
 def resolve_browse_directory(raw_value: str) -> Path:
@@ -95,24 +165,35 @@ def is_allowed_db_file(path: Path) -> bool:
 
 
 def list_browse_entries(directory: Path) -> List[Dict[str, Any]]:
-    """列出目录条目"""
+    """列出目录条目
+
+    使用 os.scandir：目录项自带文件类型，排序和类型判断不再逐个 stat，
+    每个条目只在读取大小和修改时间时 stat 一次。
+    """
     entries = []
+    # 相对路径前缀只计算一次，每个条目只做字符串拼接，不再逐个构造 Path 对象
+    relative_dir = str(directory.relative_to(config.BROWSER_ROOT))
+    prefix = '' if relative_dir == '.' else relative_dir + os.sep
 
     try:
-        for item in sorted(directory.iterdir(), key=lambda p: (p.is_file(), p.name.lower())):
-            try:
-                stat = item.stat()
-                entries.append({
-                    'name': item.name,
-                    'type': 'directory' if item.is_dir() else 'file',
-                    'size': stat.st_size if item.is_file() else None,
-                    'modified': stat.st_mtime,
-                    'path': str(item.relative_to(config.BROWSER_ROOT))
-                })
-            except (OSError, PermissionError):
-                continue
-    except (OSError, PermissionError):
-        pass
+        with os.scandir(directory) as it:
+            items = sorted(it, key=lambda entry: (entry.is_file(), entry.name.lower()))
+    except OSError:
+        return entries
+
+    for entry in items:
+        try:
+            stat = entry.stat()
+            name = entry.name
+            entries.append({
+                'name': name,
+                'type': 'directory' if entry.is_dir() else 'file',
+                'size': stat.st_size if entry.is_file() else None,
+                'modified': stat.st_mtime,
+                'path': prefix + name
+            })
+        except OSError:
+            continue
 
     return entries
 
@@ -122,8 +203,9 @@ def quote_ident(name: str) -> str:
     return f'"{name.replace('"', '""')}"'
 
 
-def build_label_expression(label_columns: List[str], value_col: str) -> str:
-    """构建标签表达式"""
+@lru_cache(maxsize=256)
+def build_label_expression(label_columns: Tuple[str, ...], value_col: str) -> str:
+    """构建标签表达式（按列元组缓存，调用方需传入元组）"""
     if not label_columns:
         return value_col
     if len(label_columns) == 1:
@@ -133,8 +215,9 @@ def build_label_expression(label_columns: List[str], value_col: str) -> str:
     return f"({', '.join(parts)})"
 
 
-def build_order_expression(label_columns: List[str], value_col: str) -> str:
-    """构建排序表达式"""
+@lru_cache(maxsize=256)
+def build_order_expression(label_columns: Tuple[str, ...], value_col: str) -> str:
+    """构建排序表达式（按列元组缓存，调用方需传入元组）"""
     if not label_columns:
         return value_col
     return build_label_expression(label_columns, value_col)
@@ -171,14 +254,232 @@ def detect_primary_key(conn, table_name: str, fallback: str) -> str:
     return fallback
 
 
-def parse_json_body(body: str) -> Dict[str, Any]:
-    """解析JSON请求体"""
+_body_buffers = threading.local()
+
+
+def read_json_request_body(rfile: BinaryIO, length: int) -> Any:
+    """读取 length 字节的请求体并解析为 JSON
+
+    使用 orjson 时请求体用 readinto 读入本线程复用的 bytearray 并直接解析其 memoryview，
+    不为每个请求分配新的 bytes 对象（orjson 解析结果不引用输入缓冲区）。
+    """
+    if orjson is None:
+        return parse_json_body(rfile.read(length))
+
+    if length > BODY_BUFFER_MAX_BYTES:
+        buf = bytearray(length)
+    else:
+        buf = getattr(_body_buffers, 'buf', None)
+        if buf is None or len(buf) < length:
+            buf = bytearray(max(length, 64 * 1024))
+            _body_buffers.buf = buf
+
+    view = memoryview(buf)[:length]
+    received = 0
+    while received < length:
+        n = rfile.readinto(view[received:])
+        if not n:
+            break
+        received += n
+    return parse_json_body(view[:received])
+
+
+def parse_json_body(body: Union[bytes, str]) -> Dict[str, Any]:
+    """解析JSON请求体（直接接受原始字节，无需先解码）"""
     try:
+        if orjson is not None:
+            return orjson.loads(body)
         return json.loads(body)
-    except json.JSONDecodeError:
+    except ValueError:
         return {}
 
 
+class BoundedReader:
+    """请求体读取器：最多读取 length 字节，不会读到持久连接上的下一个请求"""
+
+    def __init__(self, rfile: BinaryIO, length: int):
+        self._rfile = rfile
+        self.remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        """读取至多 size 字节，请求体读完后返回空字节串"""
+        if self.remaining <= 0 or size == 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self._rfile.read(size)
+        if not data:
+            self.remaining = 0
+        else:
+            self.remaining -= len(data)
+        return data
+
+    def drain(self) -> None:
+        """读完并丢弃剩余的请求体"""
+        while self.read(MULTIPART_CHUNK_SIZE):
+            pass
+
+
+def spool_request_body(rfile: BinaryIO, length: int) -> BinaryIO:
+    """把请求体完整复制到临时文件（不超过 BODY_BUFFER_MAX_BYTES 时留在内存）并回到开头
+
+    之后的解析只读本地数据，不会在持有数据库写锁期间等待客户端网络。
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=BODY_BUFFER_MAX_BYTES)
+    reader = BoundedReader(rfile, length)
+    try:
+        while chunk := reader.read(MULTIPART_CHUNK_SIZE):
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def iter_json_items(reader: BinaryIO, prefix: str) -> Iterator[Any]:
+    """用 ijson 增量解析 JSON 并逐个产出 prefix 处的元素（如 'nodes.item'），非整数数字解析为 float
+
+    JSON 格式错误时抛出 ValueError。
+    """
+    try:
+        yield from ijson.items(reader, prefix, use_float=True)
+    except ijson.JSONError as e:
+        raise ValueError(f'Invalid JSON: {e}') from e
+
+
+def parse_content_length(head: bytes) -> int:
+    """从原始请求头中解析 Content-Length"""
+    for line in head.split(b'\r\n'):
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-length':
+            return int(value.strip() or 0)
+    return 0
+
+
+def request_body_limit(head: bytes) -> int:
+    """按原始请求头中的请求目标返回请求体大小上限：数据库上传使用上传上限，其余路由使用 JSON 上限"""
+    request_line = head.split(b'\r\n', 1)[0].split(b' ')
+    if len(request_line) >= 2:
+        if split_request_path(request_line[1].decode('latin-1')).path == UPLOAD_PATH:
+            return MAX_UPLOAD_BYTES
+    return MAX_BODY_BYTES
+
+
+def build_raw_error_response(status: HTTPStatus, message: str) -> bytes:
+    """构建完整的 JSON 错误 HTTP 响应（含状态行与响应头），供缓冲式前端不经处理器直接返回"""
+    body = build_error_response(message, status)
+    return (
+        f'HTTP/1.0 {status.value} {status.phrase}\r\n'.encode('ascii') +
+        b'Content-Type: application/json; charset=utf-8\r\n'
+        b'Content-Length: ' + str(len(body)).encode('ascii') + b'\r\n'
+        b'Connection: close\r\n\r\n' + body
+    )
+
+
+def build_payload_too_large_response() -> bytes:
+    """构建完整的 413 HTTP 响应，供缓冲式前端在不读取请求体的情况下直接返回"""
+    return build_raw_error_response(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'Payload too large')
+
+
+def parse_multipart_boundary(content_type: Optional[str]) -> Optional[bytes]:
+    """从 Content-Type 中提取 multipart 边界"""
+    if not content_type or 'boundary=' not in content_type:
+        return None
+    boundary = content_type.split('boundary=', 1)[1].split(';', 1)[0].strip().strip('"')
+    return boundary.encode('latin-1') if boundary else None
+
+
+def save_multipart_upload(rfile: BinaryIO, content_length: int, boundary: bytes,
+                          upload_dir: str) -> Optional[str]:
+    """流式解析 multipart/form-data 请求体，把第一个文件字段写入 upload_dir
+
+    按块读取并直接写入磁盘，内存占用与上传大小无关，文件内容按原始字节保存。
+    返回保存的文件名；请求体中没有文件字段或请求体不完整时返回 None。
+    """
+    remaining = content_length
+    buf = bytearray()
+
+    def fill() -> bool:
+        nonlocal remaining
+        if remaining <= 0:
+            return False
+        chunk = rfile.read(min(MULTIPART_CHUNK_SIZE, remaining))
+        if not chunk:
+            remaining = 0
+            return False
+        remaining -= len(chunk)
+        buf.extend(chunk)
+        return True
+
+    def copy_part(out: Optional[BinaryIO]) -> bool:
+        # 复制当前分段内容直到下一个分隔符；保留可能被块边界截断的分隔符前缀
+        while True:
+            idx = buf.find(body_delimiter)
+            if idx >= 0:
+                if out is not None:
+                    out.write(buf[:idx])
+                del buf[:idx + len(body_delimiter)]
+                return True
+            safe = len(buf) - len(body_delimiter) + 1
+            if safe > 0:
+                if out is not None:
+                    out.write(buf[:safe])
+                del buf[:safe]
+            if not fill():
+                return False
+
+    delimiter = b'--' + boundary
+    body_delimiter = b'\r\n' + delimiter
+
+    # 跳过前导内容，定位第一个分隔符
+    while (idx := buf.find(delimiter)) < 0:
+        if not fill():
+            return None
+    del buf[:idx + len(delimiter)]
+
+    while True:
+        while len(buf) < 2 and fill():
+            pass
+        # 结束分隔符
+        if buf[:2] == b'--':
+            return None
+
+        while (header_end := buf.find(b'\r\n\r\n')) < 0:
+            if len(buf) > MULTIPART_MAX_HEADER_BYTES or not fill():
+                return None
+        headers = buf[:header_end].decode('utf-8', errors='replace')
+        del buf[:header_end + 4]
+
+        match = _MULTIPART_FILENAME.search(headers)
+        filename = os.path.basename(match.group(1).replace('\\', '/')) if match else ''
+        if filename in ('', '.', '..'):
+            # 非文件字段或文件名无效，跳过该分段
+            if not copy_part(None):
+                return None
+            continue
+
+        # 先写入临时文件，完整接收后再替换为目标文件
+        os.makedirs(upload_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=upload_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                complete = copy_part(out)
+            if not complete:
+                os.remove(temp_path)
+                return None
+            os.replace(temp_path, os.path.join(upload_dir, filename))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        # 读完剩余的请求体（结束分隔符等），保持连接可复用
+        while fill():
+            buf.clear()
+        return filename
+
+
 def parse_query_string(query: str) -> Dict[str, List[str]]:
     """解析查询字符串"""
     if not query:
@@ -187,19 +488,61 @@ def parse_query_string(query: str) -> Dict[str, List[str]]:
             for k, v in parse_qs(query).items()}
 
 
+def get_query_param(query: str, key: str) -> Optional[str]:
+    """从查询字符串中取单个参数的首个值，不构建完整的参数字典"""
+    if not query:
+        return None
+    prefix = key + '='
+    for pair in query.split('&'):
+        if pair.startswith(prefix):
+            value = pair[len(prefix):]
+            # 大多数值（会话ID、true/false）无需解码
+            if '%' in value or '+' in value:
+                return unquote_plus(value)
+            return value
+    return None
+
+
+class RequestPath(NamedTuple):
+    """请求目标拆分后的路径与查询字符串"""
+    path: str
+    query: str
+
+
+def split_request_path(target: str) -> RequestPath:
+    """按 '?' 拆分请求目标并只规范化路径部分，服务端路径无需 scheme/netloc 解析
+
+    查询字符串保持原样（例如 db_path=C://... 中的双斜杠不会被合并），
+    且 normalize_path 的缓存键不再包含每个会话都不同的查询字符串。
+    """
+    path, _, query = target.partition('?')
+    return RequestPath(normalize_path(path), query)
+
+
 def extract_session_from_path(path: str) -> Optional[str]:
     """从路径中提取会话ID"""
-    parts = path.strip('/').split('/')
-    if 'session' in parts:
-        idx = parts.index('session')
-        if idx + 1 < len(parts):
-            return unquote(parts[idx + 1])
-    return None
+    match = _SESSION_PATH.search(path)
+    return unquote(match.group(1)) if match else None
+
+
+def json_default(value: Any) -> Any:
+    """序列化 JSON 不支持的值：BLOB 列按 UTF-8 文本输出，日期时间输出 ISO 格式"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return sanitize_payload(bytes(value))
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+# 未安装 orjson 时复用同一个编码器：json.dumps 带非默认参数时每次调用都会新建 JSONEncoder
+_JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=json_default)
 
 
 def build_json_response(data: Any, status: int = 200) -> bytes:
-    """构建JSON响应"""
-    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+    """构建JSON响应，安装了 orjson 时使用 orjson"""
+    if orjson is not None:
+        return orjson.dumps(data, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+    return _JSON_ENCODER.encode(data).encode('utf-8')
 
 
 def build_error_response(message: str, status: int = 400) -> bytes:
@@ -230,37 +573,44 @@ def validate_node_data(data: Dict[str, Any]) -> Tuple[bool, Optional[str]]:
 
 
 def validate_session_id(session_id: str) -> bool:
-    """验证会话ID格式"""
-    if not session_id:
-        return False
-    return len(session_id) == 36 and session_id.count('-') == 4
+    """验证会话ID格式：UUID 文本的连字符固定在第 8、13、18、23 位，直接比较这几位而不扫描整个字符串"""
+    return (
+        bool(session_id) and len(session_id) == 36
+        and session_id[8] == '-' and session_id[13] == '-'
+        and session_id[18] == '-' and session_id[23] == '-'
+    )
 
 
+@lru_cache(maxsize=2048)
 def normalize_path(path: str) -> str:
     """规范化路径"""
     # 确保路径以/开头
     if not path.startswith('/'):
         path = '/' + path
-    # 移除多余的斜杠
-    while '//' in path:
-        path = path.replace('//', '/')
+    # 一次替换合并所有连续斜杠，常见的无重复斜杠路径不做替换
+    if '//' in path:
+        path = _SLASH_RUN.sub('/', path)
     return path
 
 
+# 文件扩展名到内容类型的映射
+CONTENT_TYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'application/javascript; charset=utf-8',
+    '.json': 'application/json; charset=utf-8',
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.svg': 'image/svg+xml',
+    '.ico': 'image/x-icon',
+    '.txt': 'text/plain; charset=utf-8',
+}
+
+
+@lru_cache(maxsize=256)
 def get_content_type(path: str) -> str:
     """根据文件扩展名获取内容类型"""
     ext = Path(path).suffix.lower()
-    content_types = {
-        '.html': 'text/html; charset=utf-8',
-        '.css': 'text/css; charset=utf-8',
-        '.js': 'application/javascript; charset=utf-8',
-        '.json': 'application/json; charset=utf-8',
-        '.png': 'image/png',
-        '.jpg': 'image/jpeg',
-        '.jpeg': 'image/jpeg',
-        '.gif': 'image/gif',
-        '.svg': 'image/svg+xml',
-        '.ico': 'image/x-icon',
-        '.txt': 'text/plain; charset=utf-8',
-    }
-    return content_types.get(ext, 'application/octet-stream')
\ No newline at end of file
+    return CONTENT_TYPES.get(ext, 'application/octet-stream')
\ No newline at end of file
@@ -38,29 +38,33 @@ if __name__ == '__main__':
         # 如果3000端口被占用，尝试3001-3010
         if port == 3000:
             import socket
-            for test_port in range(3000, 3011):
-                try:
-                    test_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    test_socket.bind(('localhost', test_port))
-                    test_socket.close()
-                    port = test_port
-                    break
-                except OSError:
-                    continue
-            else:
-                print("Cannot find available port 3000-3010")
-                sys.exit(1)
+            # 与服务器一样设置 SO_REUSEADDR：TIME_WAIT 中的端口对服务器可用，探测时也应视为可用。
+            # Windows 上 SO_REUSEADDR 允许绑定其他进程正在监听的端口，改用 SO_EXCLUSIVEADDRUSE；
+            # 绑定失败的套接字可以继续尝试下一个端口，整个探测只创建一个套接字
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as test_socket:
+                if os.name == 'nt':
+                    test_socket.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+                else:
+                    test_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                for test_port in range(3000, 3011):
+                    try:
+                        test_socket.bind(('localhost', test_port))
+                        port = test_port
+                        break
+                    except OSError:
+                        continue
+                else:
+                    print("Cannot find available port 3000-3010")
+                    sys.exit(1)
 
         # 设置端口环境变量
         os.environ['PORT'] = str(port)
         print(f"Using port: {port}")
 
-        # 导入并运行新的模块化应用
-        # Change to server directory and run
-        import subprocess
-        import sys
-        result = subprocess.run([sys.executable, 'app.py'], cwd='server')
-        sys.exit(result.returncode)
+        # 在当前进程内导入并运行模块化应用，不再启动第二个解释器
+        os.chdir(server_dir)
+        from app import main
+        main()
     except KeyboardInterrupt:
         print("\nServer stopped")
         sys.exit(0)